@@ -0,0 +1,315 @@
+from argparse import ArgumentParser
+from contextlib import contextmanager
+from datetime import date, datetime
+from json import dump
+from json import load as load_json
+from os import chdir, getcwd, makedirs
+from os.path import exists, join
+from shutil import copy, rmtree
+from typing import Any, Callable
+
+import numpy as np
+from polars import (
+    Config,
+    DataFrame,
+    Date,
+    Datetime,
+    Float64,
+    Series,
+    col,
+    collect_all,
+    concat,
+    read_csv,
+    when,
+)
+
+import instrument
+from clean import exporting, graph
+from dag import run
+from downsample import lttb, stratified
+from incremental import refresh
+from partition import scan_partitioned
+from utils import read
+
+ROOT = 'bench'
+RESULTS = join(ROOT, 'results')
+CHUNK = 5_000_000
+START = datetime(2020, 1, 1)
+END = datetime(2022, 5, 1)
+LINES = 3
+WHOLESALE = 2
+WHOLESALE_SHARE = 0.5
+SHORT_TIMES = 0.05
+DUPLICATES = 0.01
+POINTS = 20000
+NOISE = 0.05
+MEMORY_NOISE = 16
+
+
+def dates(rng: np.random.Generator, n: int, start: str, end: str) -> Series:
+    days = rng.integers(
+        np.datetime64(start, 'D').astype(int),
+        np.datetime64(end, 'D').astype(int),
+        n,
+    )
+    return Series(days.astype(np.int32)).cast(Date).dt.strftime('%-m/%-d/%Y')
+
+
+def customers(rng: np.random.Generator, n: int, stores: np.ndarray) -> DataFrame:
+    ids = Series('customer_id', np.arange(1, n + 1))
+    return DataFrame(
+        [
+            ids,
+            Series('home_store', rng.choice(stores, n)),
+            Series('gender', rng.choice(['F', 'M', 'Not Specified'], n)),
+            ('Customer ' + ids.cast(str)).alias('customer_first-name'),
+            dates(rng, n, '1950-01-01', '2005-01-01').alias('birthdate'),
+            (ids.cast(str) + '@example.com').alias('customer_email'),
+            dates(rng, n, '2017-01-01', '2020-01-01').alias('customer_since'),
+            Series(
+                'loyalty_card_number',
+                rng.integers(10**9, 10**10, n),
+            ).cast(str),
+        ]
+    )
+
+
+def sales(
+    rng: np.random.Generator,
+    n: int,
+    start: datetime,
+    end: datetime,
+    offset: int,
+    dims: dict[str, np.ndarray],
+) -> DataFrame:
+    orders = max(n // LINES, 1)
+    header = DataFrame(
+        {
+            'transaction_id': np.arange(offset, offset + orders),
+            'time': np.sort(
+                rng.integers(int(start.timestamp()), int(end.timestamp()), orders)
+            )
+            * 10**6,
+            'store_id': rng.choice(dims['store'], orders),
+            'staff_id': rng.choice(dims['staff'], orders),
+            'customer_id': np.where(
+                rng.random(orders) < WHOLESALE_SHARE,
+                rng.choice(dims['customer'][:WHOLESALE], orders),
+                rng.choice(dims['customer'][WHOLESALE:], orders),
+            ),
+            'short': rng.random(orders) < SHORT_TIMES,
+        }
+    ).with_columns(col('time').cast(Datetime))
+    product = rng.integers(0, len(dims['product']), n)
+    lines = DataFrame(
+        {
+            'order': np.sort(rng.integers(0, orders, n)),
+            'product_id': dims['product'][product],
+            'quantity_sold': rng.integers(1, 4, n),
+            'unit_price': dims['price'][product],
+            'promo_item_yn': rng.choice(['Y', 'N'], n, p=[0.2, 0.8]),
+        }
+    )
+    # exact duplicate line items, next to their originals like in the real exports
+    lines = concat([lines, lines.filter(rng.random(n) < DUPLICATES)]).sort('order')
+    return (
+        header[lines['order'].to_numpy()]
+        .hstack(lines)
+        .select(
+            'transaction_id',
+            col('time').dt.strftime('%-m/%-d/%Y').alias('transaction_date'),
+            when(col('short'))
+            .then(col('time').dt.strftime('%-H:%M'))
+            .otherwise(col('time').dt.strftime('%-H:%M:%S'))
+            .alias('transaction_time'),
+            'store_id',
+            'staff_id',
+            'customer_id',
+            'product_id',
+            'quantity_sold',
+            col('unit_price').cast(str).str.replace('.', ',', literal=True),
+            'promo_item_yn',
+        )
+    )
+
+
+def generate(root: str, rows: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    raw = join(root, 'raw')
+    rmtree(raw, ignore_errors=True)
+    makedirs(join(raw, 'sales'))
+    for name in ('store', 'employee', 'product'):
+        copy(join('raw', f'{name}.csv'), raw)
+    store = read_csv(join(raw, 'store.csv'))
+    product = read_csv(join(raw, 'product.csv'))
+    stores = store.filter(col('store_type') == 'retail')['store_id'].to_numpy()
+    customer = customers(rng, max(rows // 20, 1000), stores)
+    customer.write_csv(join(raw, 'customer.csv'))
+    dims = {
+        'store': stores,
+        'staff': read_csv(join(raw, 'employee.csv'))['staff_id'].to_numpy(),
+        'customer': customer['customer_id'].to_numpy(),
+        'product': product['product_id'].to_numpy(),
+        'price': product['current_retail_price'].to_numpy(),
+    }
+    chunks = -(-rows // CHUNK)
+    span = (END - START) / chunks
+    for i in range(chunks):
+        n = min(CHUNK, rows - i * CHUNK)
+        sales(
+            rng, n, START + i * span, START + (i + 1) * span, i * CHUNK, dims
+        ).write_csv(join(raw, 'sales', f'{i:04}.csv'))
+
+
+@contextmanager
+def measure(results: dict[str, dict], name: str):
+    with instrument.measure(name) as record:
+        yield
+    results[name] = {
+        'seconds': round(record['wall'], 3),
+        'peak_mib': round(record['peak_rss'] / 2**20, 1),
+        'delta_mib': round(record['rss_delta'] / 2**20, 1),
+    }
+
+
+def timed(results: dict[str, dict], name: str, fn: Callable[..., Any]):
+    def stage(*deps: Any) -> Any:
+        with measure(results, name):
+            return fn(*deps)
+
+    return stage
+
+
+def profile(rows: int, seed: int = 0, fmt: str = 'parquet') -> dict[str, dict]:
+    results = {}
+    work = join(ROOT, str(rows))
+    with measure(results, 'generate'):
+        generate(work, rows, seed)
+    cwd = getcwd()
+    chdir(work)
+    try:
+        nodes = graph()
+        outputs = [name for name in nodes if '/' in name]
+        for name in outputs:
+            fn, deps = nodes[name]
+            nodes[name] = (exporting(fn, name, fmt, 'off'), deps)
+        run(
+            {
+                name: (timed(results, f'clean:{name}', fn), deps)
+                for name, (fn, deps) in nodes.items()
+            },
+            1,
+        )
+        for mode, streaming in (('lazy', False), ('streaming', True)):
+            with measure(results, f'clean:{mode}'):
+                frames = run(graph(lazy=True, streaming=streaming), 1)
+                collect_all(
+                    [frames[name] for name in outputs],
+                    common_subplan_elimination=not streaming,
+                    streaming=streaming,
+                )
+        for table in ('b2c/order_by_date', 'b2c/total_by_customer', 'b2c/segment'):
+            with measure(results, f'load:{table}'):
+                read(table)
+        with measure(results, 'load:lttb'):
+            lttb(read('b2c/order_by_date'), 'date', 'total', POINTS)
+        with measure(results, 'load:stratified'):
+            stratified(read('b2c/segment'), POINTS, 'segment')
+        with measure(results, 'load:sales_month'):
+            scan_partitioned('b2c/sales', date(2021, 3, 1), date(2021, 4, 1)).collect()
+        rmtree('state', ignore_errors=True)
+        with measure(results, 'incremental:full'):
+            refresh(fmt)
+        with measure(results, 'incremental:noop'):
+            refresh(fmt)
+    finally:
+        chdir(cwd)
+    return results
+
+
+def compare(
+    results: dict[str, dict],
+    baseline: dict[str, dict],
+    tolerance: float,
+) -> DataFrame:
+    return (
+        DataFrame(
+            [
+                {
+                    'stage': name,
+                    **r,
+                    'base_seconds': baseline.get(name, {}).get('seconds'),
+                    'base_delta_mib': baseline.get(name, {}).get('delta_mib'),
+                }
+                for name, r in results.items()
+            ]
+        )
+        .with_columns(col('base_seconds', 'base_delta_mib').cast(Float64))
+        .with_columns(
+            (col('seconds') / col('base_seconds')).round(2).alias('time_ratio'),
+            (col('delta_mib') / col('base_delta_mib')).round(2).alias('delta_ratio'),
+        )
+        .with_columns(
+            (
+                (col('seconds') > NOISE) & (col('time_ratio') > 1 + tolerance)
+                # peak rss carries every earlier stage, so only a stage's own growth
+                | (col('delta_mib') > MEMORY_NOISE)
+                & (col('delta_ratio') > 1 + tolerance)
+            )
+            .fill_null(False)
+            .alias('regressed')
+        )
+    )
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument(
+        'rows',
+        type=int,
+        nargs='*',
+        default=[100_000],
+        help='number of synthetic sales line items per run',
+    )
+    parser.add_argument('--seed', type=int, default=0, help='random seed')
+    parser.add_argument(
+        '--format',
+        default='parquet',
+        help='storage format of the outputs',
+    )
+    parser.add_argument(
+        '--tolerance',
+        type=float,
+        default=0.2,
+        help='relative slowdown or memory growth reported as a regression',
+    )
+    parser.add_argument(
+        '--save',
+        action='store_true',
+        help='store the results as the baseline for later runs',
+    )
+    args = parser.parse_args()
+
+    makedirs(RESULTS, exist_ok=True)
+    regressed = False
+    for rows in args.rows:
+        results = profile(rows, args.seed, args.format)
+        path = join(RESULTS, f'{rows}.json')
+        baseline = {}
+        if exists(path):
+            with open(path) as f:
+                baseline = load_json(f)
+        report = compare(results, baseline, args.tolerance)
+        with Config(tbl_rows=-1, tbl_cols=-1, tbl_width_chars=160):
+            print(f'{rows} rows')
+            print(report)
+        regressed |= report['regressed'].any()
+        if args.save or not baseline:
+            with open(path, 'w') as f:
+                dump(results, f, indent=2)
+    if regressed:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
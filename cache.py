@@ -0,0 +1,144 @@
+from hashlib import sha256
+from inspect import iscode, isfunction, unwrap
+from json import dump, dumps
+from json import load as load_json
+from os import walk
+from os.path import abspath, dirname, exists, getmtime, getsize, isdir, join
+from typing import Any, Callable
+
+from dag import Node
+
+MANIFEST = 'manifest.json'
+ROOT = dirname(abspath(__file__))
+
+
+def digest(path: str) -> str:
+    h = sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def files(path: str) -> list[str]:
+    if not isdir(path):
+        return [path]
+    return sorted(join(d, f) for d, _, names in walk(path) for f in names)
+
+
+def stat(path: str) -> list[list]:
+    return [[f, getmtime(f), getsize(f)] for f in files(path)]
+
+
+def combine(*parts: Any) -> str:
+    return sha256(dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def read_manifest(path: str = MANIFEST) -> dict[str, dict]:
+    if not exists(path):
+        return {'inputs': {}, 'outputs': {}}
+    with open(path) as f:
+        return load_json(f)
+
+
+def write_manifest(manifest: dict[str, dict], path: str = MANIFEST):
+    with open(path, 'w') as f:
+        dump(manifest, f, indent=2, sort_keys=True)
+
+
+def hashed(path: str, inputs: dict[str, dict]) -> str:
+    # rehash only what was touched since the last run
+    mtime = getmtime(path)
+    entry = inputs.get(path)
+    if not entry or entry['mtime'] != mtime:
+        entry = inputs[path] = {'mtime': mtime, 'hash': digest(path)}
+    return entry['hash']
+
+
+def modules(fn: Callable[..., Any]) -> list[str]:
+    # files of this repo that define fn and, in turn, every function it calls
+    found = set()
+    seen = set()
+    todo = [fn]
+    while todo:
+        fn = todo.pop()
+        if not isfunction(fn) or fn in seen:
+            continue
+        seen.add(fn)
+        fn = unwrap(fn)
+        path = abspath(fn.__code__.co_filename)
+        if dirname(path) != ROOT or not exists(path):
+            continue
+        found.add(path)
+        codes = [fn.__code__]
+        while codes:
+            code = codes.pop()
+            codes += [c for c in code.co_consts if iscode(c)]
+            todo += [fn.__globals__[n] for n in code.co_names if n in fn.__globals__]
+    return sorted(found)
+
+
+def fingerprints(
+    nodes: dict[str, Node],
+    sources: dict[str, list[str]],
+    manifest: dict[str, dict],
+    params: dict[str, Any],
+    write: Callable[..., Any] | None = None,
+) -> dict[str, str]:
+    # a node only changes with its own code, sources and params, and its deps
+    written = modules(write) if write else []
+    done = {}
+
+    def visit(name: str) -> str:
+        if name not in done:
+            fn, deps = nodes[name]
+            code = modules(fn) + (written if '/' in name else [])
+            done[name] = combine(
+                name,
+                [hashed(f, manifest['inputs']) for f in sorted(set(code))],
+                params.get(name),
+                [hashed(f, manifest['inputs']) for f in sources.get(name, [])],
+                [visit(d) for d in deps],
+            )
+        return done[name]
+
+    for name in nodes:
+        visit(name)
+    manifest['inputs'] = {f: e for f, e in manifest['inputs'].items() if exists(f)}
+    return done
+
+
+def stale(
+    outputs: dict[str, str],
+    prints: dict[str, str],
+    manifest: dict[str, dict],
+) -> list[str]:
+    return [
+        name
+        for name, file in outputs.items()
+        if not exists(file)
+        or manifest['outputs'].get(name, {}).get('file') != file
+        or manifest['outputs'].get(name, {}).get('fingerprint') != prints[name]
+        # rewritten since, e.g. by rfm.py, segment.py or incremental.py
+        or manifest['outputs'].get(name, {}).get('stat') != stat(file)
+    ]
+
+
+def needed(nodes: dict[str, Node], names: list[str]) -> dict[str, Node]:
+    keep = set()
+    todo = list(names)
+    while todo:
+        name = todo.pop()
+        if name not in keep:
+            keep.add(name)
+            todo += nodes[name][1]
+    return {name: node for name, node in nodes.items() if name in keep}
+
+
+def record(manifest: dict[str, dict], name: str, file: str, fingerprint: str):
+    manifest['outputs'][name] = {
+        'file': file,
+        'fingerprint': fingerprint,
+        'hash': combine(*(digest(f) for f in files(file))),
+        'stat': stat(file),
+    }
@@ -0,0 +1,114 @@
+from argparse import ArgumentTypeError
+from functools import reduce
+from operator import or_
+
+from polars import DataFrame, LazyFrame, col, concat, count, lit
+
+from instrument import instrumented
+
+Frame = DataFrame | LazyFrame
+PERIOD = '1mo'
+STORE = 'state/classify'
+STATS = ['lines', 'orders', 'volume']
+RULES = {
+    'lines': col('lines'),
+    'orders': col('orders'),
+    'basket': col('lines') / col('orders'),
+    'volume': col('volume'),
+}
+THRESHOLDS = {'lines': 1000}
+
+
+@instrumented
+def periods(sales: Frame) -> Frame:
+    return (
+        sales.groupby(
+            'customer_id',
+            'time',
+            'id',
+            'store_id',
+            'staff_id',
+        )
+        .agg(
+            count().alias('lines'),
+            col('quantity').sum(),
+        )
+        .groupby(
+            'customer_id',
+            col('time').dt.truncate(PERIOD).alias('period'),
+        )
+        .agg(
+            count().alias('orders'),
+            col('lines', 'quantity').sum(),
+        )
+    )
+
+
+def fold(*parts: Frame) -> Frame:
+    return (
+        concat(parts)
+        .groupby('customer_id', 'period')
+        .agg(col('orders', 'lines', 'quantity').sum())
+    )
+
+
+@instrumented
+def stats(periods: Frame) -> Frame:
+    return periods.groupby('customer_id').agg(
+        col('lines', 'orders').sum(),
+        col('quantity').max().alias('volume'),
+    )
+
+
+def describe(thresholds: dict[str, float]) -> str:
+    return ','.join(f'{name}>{t:g}' for name, t in sorted(thresholds.items()))
+
+
+@instrumented
+def decide(
+    stats: Frame,
+    thresholds: dict[str, float] = THRESHOLDS,
+    cached: Frame | None = None,
+) -> Frame:
+    rules = describe(thresholds)
+    if cached is not None:
+        # customers whose stats are unchanged under the same rules keep their decision
+        known = stats.join(
+            cached.filter(col('rules') == rules).with_columns(
+                col(name).cast(dtype) for name, dtype in stats.schema.items()
+            ),
+            on=['customer_id', *STATS],
+        )
+        stats = stats.join(known, on='customer_id', how='anti')
+    fresh = stats.with_columns(
+        reduce(or_, [RULES[name] > t for name, t in thresholds.items()]).alias('b2b'),
+        lit(rules).alias('rules'),
+    )
+    if cached is None:
+        return fresh
+    return concat([known.select(fresh.columns), fresh])
+
+
+@instrumented
+def split(sales: Frame, decisions: Frame) -> tuple[Frame, Frame]:
+    df = sales.join(
+        decisions.select('customer_id', 'b2b'),
+        on='customer_id',
+        how='left',
+    )
+    if isinstance(df, DataFrame):
+        parts = df.partition_by('b2b', as_dict=True)
+        return tuple(parts.get(flag, df.clear()).drop('b2b') for flag in (True, False))
+    return (
+        df.filter(col('b2b')).drop('b2b'),
+        df.filter(~col('b2b')).drop('b2b'),
+    )
+
+
+def rule(spec: str) -> tuple[str, float]:
+    name, _, threshold = spec.partition('=')
+    if name not in RULES or not threshold:
+        raise ArgumentTypeError(
+            f'expected NAME=THRESHOLD with NAME one of {", ".join(RULES)}'
+        )
+    return name, float(threshold)
@@ -1,290 +1,319 @@
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from glob import glob
+from operator import itemgetter
+from typing import Callable
+
 from polars import (
+    Config,
     DataFrame,
     Date,
-    Datetime,
+    Expr,
     Float64,
     Int32,
-    Series,
+    LazyFrame,
+    Time,
+    Utf8,
+    coalesce,
     col,
+    collect_all,
     concat,
-    concat_str,
-    date,
     lit,
     read_csv,
+    scan_csv,
+    struct,
+    threadpool_size,
     when,
 )
 
-from utils import export
-
-customer = (
-    read_csv(
-        'raw/customer.csv',
+from cache import fingerprints, needed, read_manifest, record, stale, write_manifest
+from classify import THRESHOLDS, decide, periods, rule, split, stats
+from cube import ROLLUPS, base, daily, rollup
+from dag import Node, run
+from dims import gather, index
+from finance import finance, monthly
+from instrument import enable, instrumented, summary, write
+from partition import write_partitioned
+from rfm import orders, score, summarize
+from schema import compact
+from segment import segment, segment_count
+from staff import facts, quarters
+from timeline import at, hourly, timeline
+from utils import FORMATS, VERIFY, export
+
+Frame = DataFrame | LazyFrame
+PARTITIONED = {'b2b/sales', 'b2c/sales'}
+# rollups of the sales that sum across partitions, by their keys
+PARTIALS = {
+    'periods': (periods, ['customer_id', 'period']),
+    'monthly': (
+        lambda sales: monthly(line_total(sales)),
+        ['store_id', 'month', 'product_id'],
+    ),
+    'quarters': (quarters, ['staff_id', 'quarter']),
+}
+# parsed by parse_sales, whatever the csv reader would infer for them
+TEXT = {'transaction_time': Utf8, 'unit_price': Utf8}
+
+
+def load(path: str, lazy: bool) -> Frame:
+    if lazy:
+        return scan_csv(path, dtypes=TEXT)
+    return read_csv(
+        path,
         use_pyarrow=True,
+        dtypes=TEXT,
     )
-    .with_columns(
-        col(
+
+
+def partitions() -> list[str]:
+    return sorted(glob('raw/sales/*.csv'))
+
+
+def sources() -> dict[str, list[str]]:
+    return {
+        'data/customer': ['raw/customer.csv'],
+        'data/store': ['raw/store.csv'],
+        'data/employee': ['raw/employee.csv'],
+        'data/product': ['raw/product.csv'],
+        'sales': partitions(),
+    }
+
+
+@instrumented
+def clean_customer(df: Frame) -> Frame:
+    return (
+        df.with_columns(
+            col(
+                'birthdate',
+                'customer_since',
+            ).str.strptime(
+                Date,
+                format='%m/%d/%Y',
+            ),
+            col('gender').str.replace(
+                'Not Specified',
+                'na',
+            ),
+        )
+        .drop_nulls()
+        .unique(maintain_order=True)
+        .rename(
+            {
+                'customer_id': 'id',
+                'home_store': 'store',
+                'customer_since': 'since',
+            }
+        )
+        .with_columns(
+            age=2022 - col('birthdate').dt.year().cast(Int32),
+        )
+        .drop(
             'birthdate',
-            'customer_since',
-        ).str.strptime(
-            Date,
-            format='%m/%d/%Y',
-        ),
-        col('gender').str.replace(
-            'Not Specified',
-            'na',
-        ),
-    )
-    .drop_nulls()
-    .unique(maintain_order=True)
-    .rename(
-        {
-            'customer_id': 'id',
-            'home_store': 'store',
-            'customer_since': 'since',
-        }
-    )
-    .with_columns(
-        age=2022 - col('birthdate').dt.year().cast(Int32),
-    )
-    .drop(
-        'birthdate',
-        'customer_first-name',
-        'customer_email',
-        'loyalty_card_number',
+            'customer_first-name',
+            'customer_email',
+            'loyalty_card_number',
+        )
+        .pipe(compact, 'data/customer')
+        .sort('id')
     )
-    .sort('id')
-)
-export(customer, 'data/customer.csv')
 
-store = (
-    read_csv(
-        'raw/store.csv',
-        use_pyarrow=True,
-    )
-    .drop(
-        'store_city',
-        'store_state_province',
-        'store_postal_code',
-        'Neighorhood',
-    )
-    .rename(
-        {
-            'store_id': 'id',
-            'store_address': 'address',
-            'store_type': 'type',
-            'store_square_feet': 'square_feet',
-            'store_longitude': 'longitude',
-            'store_latitude': 'latitude',
-        }
-    )
-    .unique(maintain_order=True)
-    .sort('id')
-)
-export(store, 'data/store.csv')
 
-customer_per_store = (
-    customer.groupby(
-        'store',
-        maintain_order=True,
-    )
-    .count()
-    .join(
-        store,
-        left_on='store',
-        right_on='id',
-    )
-    .select(
-        'store',
-        'address',
-        'latitude',
-        'longitude',
-        'count',
+@instrumented
+def clean_store(df: Frame) -> Frame:
+    return (
+        df.drop(
+            'store_city',
+            'store_state_province',
+            'store_postal_code',
+            'Neighorhood',
+        )
+        .rename(
+            {
+                'store_id': 'id',
+                'store_address': 'address',
+                'store_type': 'type',
+                'store_square_feet': 'square_feet',
+                'store_longitude': 'longitude',
+                'store_latitude': 'latitude',
+            }
+        )
+        .unique(maintain_order=True)
+        .pipe(compact, 'data/store')
+        .sort('id')
     )
-)
-export(customer_per_store, 'b2c/customer_per_store.csv')
 
-employee = (
-    read_csv(
-        'raw/employee.csv',
-        use_pyarrow=True,
-    )
-    .with_columns(
-        col('start_date').str.strptime(
-            Date,
-            format='%m/%d/%Y',
+
+@instrumented
+def customer_per_store(customer: Frame, store: DataFrame) -> Frame:
+    return (
+        customer.groupby(
+            'store',
+            maintain_order=True,
+        )
+        .count()
+        .pipe(gather, store, 'store')
+        .select(
+            'store',
+            'address',
+            'latitude',
+            'longitude',
+            'count',
         )
     )
-    .drop(
-        'first_name',
-        'last_name',
-        'end_date',
-    )
-    .drop_nulls()
-    .unique(maintain_order=True)
-    .rename(
-        {
-            'staff_id': 'id',
-            'start_date': 'onboard',
-        }
-    )
-    .sort('id')
-)
-export(employee, 'data/employee.csv')
 
-product = (
-    read_csv(
-        'raw/product.csv',
-        use_pyarrow=True,
-    )
-    .with_columns(
-        col(
-            'tax_exempt_yn',
-            'promo_yn',
-            'new_product_yn',
-        ).map_dict(
+
+@instrumented
+def clean_employee(df: Frame) -> Frame:
+    return (
+        df.with_columns(
+            col('start_date').str.strptime(
+                Date,
+                format='%m/%d/%Y',
+            )
+        )
+        .drop(
+            'first_name',
+            'last_name',
+            'end_date',
+        )
+        .drop_nulls()
+        .unique(maintain_order=True)
+        .rename(
             {
-                'N': False,
-                'Y': True,
+                'staff_id': 'id',
+                'start_date': 'onboard',
             }
         )
+        .pipe(compact, 'data/employee')
+        .sort('id')
     )
-    .drop_nulls()
-    .unique(maintain_order=True)
-    .drop('product_description')
-    .rename(
-        {
-            'product_id': 'id',
-            'product_group': 'group',
-            'product_category': 'category',
-            'product_type': 'type',
-            'product': 'name',
-            'unit_of_measure': 'unit',
-            'current_cost': 'cost',
-            'current_wholesale_price': 'wholesale',
-            'current_retail_price': 'retail',
-            'tax_exempt_yn': 'is_tax_exempt',
-            'promo_yn': 'is_promo',
-            'new_product_yn': 'is_new',
-        }
-    )
-    .sort('id')
-)
-export(product, 'data/product.csv')
-
-sales = (
-    concat(
-        [
-            read_csv(
-                f'raw/sales/202{i}.csv',
-                use_pyarrow=True,
-            ).with_columns(
-                concat_str(
-                    [
-                        col('transaction_date'),
-                        when(col('transaction_time').str.count_match(':') == 1)
-                        .then(col('transaction_time') + ':00')
-                        .otherwise(col('transaction_time')),
-                    ]
-                )
-                .str.strptime(
-                    Datetime,
-                    format='%m/%d/%Y %H:%M:%S',
-                )
-                .alias('time'),
-                col('unit_price').str.replace(',', '.').cast(Float64),
+
+
+@instrumented
+def clean_product(df: Frame) -> Frame:
+    return (
+        df.with_columns(
+            col(
+                'tax_exempt_yn',
+                'promo_yn',
+                'new_product_yn',
             )
-            for i in range(3)
-        ]
-    )
-    .with_columns(
-        col('promo_item_yn').map_dict(
+            == 'Y'
+        )
+        .drop_nulls()
+        .unique(maintain_order=True)
+        .drop('product_description')
+        .rename(
             {
-                'N': False,
-                'Y': True,
+                'product_id': 'id',
+                'product_group': 'group',
+                'product_category': 'category',
+                'product_type': 'type',
+                'product': 'name',
+                'unit_of_measure': 'unit',
+                'current_cost': 'cost',
+                'current_wholesale_price': 'wholesale',
+                'current_retail_price': 'retail',
+                'tax_exempt_yn': 'is_tax_exempt',
+                'promo_yn': 'is_promo',
+                'new_product_yn': 'is_new',
             }
-        ),
+        )
+        .pipe(compact, 'data/product')
+        .sort('id')
     )
-    .drop_nulls()
-    .unique(maintain_order=True)
-    .drop(
-        'transaction_date',
-        'transaction_time',
+
+
+def parse_time(e: Expr) -> Expr:
+    # whatever the first format misses must parse with the second, or it fails
+    first = e.str.strptime(Time, format='%H:%M:%S', strict=False, cache=True)
+    return coalesce(
+        first,
+        when(first.is_null()).then(e).str.strptime(Time, format='%H:%M', cache=True),
     )
-    .rename(
-        {
-            'promo_item_yn': 'is_promo',
-            'unit_price': 'price',
-            'transaction_id': 'id',
-            'quantity_sold': 'quantity',
-        }
+
+
+@instrumented
+def parse_sales(df: Frame) -> Frame:
+    return df.with_columns(
+        col('transaction_date')
+        .str.strptime(Date, format='%m/%d/%Y', cache=True)
+        .dt.combine(parse_time(col('transaction_time')))
+        .alias('time'),
+        col('unit_price').str.replace(',', '.', literal=True).cast(Float64),
     )
-    .sort('time')
-)
-non_retail = (
-    sales.groupby('customer_id', maintain_order=True)
-    .count()
-    .filter(col('count') > 1000)
-)
 
-b2b_sales = sales.filter(
-    col('customer_id').is_in(non_retail['customer_id']),
-)
-b2c_sales = sales.filter(
-    ~col('customer_id').is_in(non_retail['customer_id']),
-)
 
+@instrumented
+def clean_sales(dfs: list[Frame]) -> Frame:
+    return dedup_sales(dfs).sort('time')
 
-def reid_sales(df: DataFrame, out: str) -> DataFrame:
-    new = (
-        df.drop(
-            'product_id',
-            'quantity',
-            'price',
-            'is_promo',
+
+@instrumented
+def dedup_sales(dfs: list[Frame]) -> Frame:
+    return (
+        concat([parse_sales(df) for df in dfs])
+        .with_columns(
+            col('promo_item_yn') == 'Y',
         )
+        .drop_nulls()
         .unique(maintain_order=True)
-        .sort('time')
-    )
-    new = (
-        new.with_columns(
-            Series('_id', range(1, len(new) + 1)),
+        .drop(
+            'transaction_date',
+            'transaction_time',
         )
-        .join(
-            df,
-            on=[
-                'time',
-                'id',
-                'store_id',
-                'staff_id',
-                'customer_id',
-            ],
+        .rename(
+            {
+                'promo_item_yn': 'is_promo',
+                'unit_price': 'price',
+                'transaction_id': 'id',
+                'quantity_sold': 'quantity',
+            }
         )
-        .drop('id')
+        .pipe(compact, 'sales')
     )
-    new = new.select(sorted(new.columns)).rename({'_id': 'id'})
-    export(new, out)
-    return new
 
 
-b2b = reid_sales(b2b_sales, 'b2b/sales.csv')
-b2c = reid_sales(b2c_sales, 'b2c/sales.csv')
+@instrumented
+def reid_sales(df: Frame) -> Frame:
+    new = df.with_columns(
+        struct(
+            'time',
+            'id',
+            'store_id',
+            'staff_id',
+            'customer_id',
+        )
+        .rank('dense')
+        .alias('_id'),
+    ).drop('id')
+    return new.select(sorted(new.columns)).rename({'_id': 'id'})
 
-non_retail = (
-    b2b.groupby('id', 'customer_id', maintain_order=True)
-    .count()
-    .groupby('customer_id', maintain_order=True)
-    .count()
-    .sort('customer_id')
-)
-export(non_retail, 'findings/non_retail.csv')
 
+@instrumented
+def line_total(df: Frame) -> Frame:
+    return df.with_columns(
+        (col('quantity') * col('price')).alias('total'),
+    )
 
-def total_by_order(df: DataFrame, out: str) -> DataFrame:
-    new = (
-        df.with_columns(
-            (col('quantity') * col('price')).alias('total'),
-        )
-        .groupby(
+
+@instrumented
+def non_retail(df: Frame) -> Frame:
+    return (
+        df.groupby('id', 'customer_id', maintain_order=True)
+        .count()
+        .groupby('customer_id', maintain_order=True)
+        .count()
+        .sort('customer_id')
+    )
+
+
+@instrumented
+def total_by_order(df: Frame) -> Frame:
+    return (
+        df.groupby(
             'id',
             'time',
             maintain_order=True,
@@ -298,89 +327,12 @@ def total_by_order(df: DataFrame, out: str) -> DataFrame:
         )
         .sort('id')
     )
-    export(new, out)
-    return new
-
-
-b2b_total_by_order = total_by_order(b2b, 'b2b/total_by_order.csv')
-b2c_total_by_order = total_by_order(b2c, 'b2c/total_by_order.csv')
-
-
-def order_by_date(df: DataFrame, out: str) -> DataFrame:
-    new = (
-        df.with_columns(
-            col('time').dt.date().alias('date'),
-        )
-        .groupby('date', maintain_order=True)
-        .sum()
-        .drop(
-            'id',
-            'time',
-        )
-        .with_columns(
-            col('total').round(2).alias('total'),
-        )
-    )
-    export(new, out)
-    return new
-
-
-b2b_order_by_date = order_by_date(b2b_total_by_order, 'b2b/order_by_date.csv')
-b2c_order_by_date = order_by_date(b2c_total_by_order, 'b2c/order_by_date.csv')
-
 
-def order_by_month(df: DataFrame, out: str) -> DataFrame:
-    new = (
-        df.with_columns(
-            col('date').dt.month_start().alias('month'),
-        )
-        .groupby('month', maintain_order=True)
-        .sum()
-        .drop('date')
-        .with_columns(
-            col('total').round(2).alias('total'),
-        )
-    )
-    export(new, out)
-    return new
 
-
-b2b_order_by_month = order_by_month(b2b_order_by_date, 'b2b/order_by_month.csv')
-b2c_order_by_month = order_by_month(b2c_order_by_date, 'b2c/order_by_month.csv')
-
-rfm = (
-    b2c_total_by_order.join(
-        b2c,
-        on='id',
-    )
-    .select(
-        'customer_id',
-        'time',
-        'total',
-    )
-    .groupby(
-        'customer_id',
-        maintain_order=True,
-    )
-    .agg(
-        (date(2022, 5, 1) - col('time').max()).dt.days().alias('recency'),
-        col('time').count().alias('frequency'),
-        col('total').sum().round(2).alias('monetary'),
-    )
-    .sort(
-        'frequency',
-        descending=True,
-    )
-)
-export(rfm, 'b2c/rfm.csv')
-
-
-def total_by_product(df: DataFrame, out: str) -> DataFrame:
-    new = (
-        df.with_columns(
-            (col('quantity') * col('price')).alias('total'),
-        )
-        .groupby(
+@instrumented
+def total_by_product(df: Frame, product: DataFrame) -> Frame:
+    return (
+        df.groupby(
             'product_id',
             maintain_order=True,
         )
@@ -390,31 +342,19 @@ def total_by_product(df: DataFrame, out: str) -> DataFrame:
             'quantity',
             col('total').round(2),
         )
-        .join(
-            product,
-            left_on='product_id',
-            right_on='id',
-        )
+        .pipe(gather, product, 'product_id')
         .drop(
             'is_promo',
             'is_new',
         )  # 100% not promo and not new
         .sort('product_id')
     )
-    export(new, out)
-    return new
-
-
-b2b_total_by_product = total_by_product(b2b, 'b2b/total_by_product.csv')
-b2c_total_by_product = total_by_product(b2c, 'b2c/total_by_product.csv')
 
 
-def total_by_customer(df: DataFrame, out: str) -> DataFrame:
-    new = (
-        df.with_columns(
-            (col('quantity') * col('price')).alias('total'),
-        )
-        .groupby(
+@instrumented
+def total_by_customer(df: Frame, customer: DataFrame) -> Frame:
+    return (
+        df.groupby(
             'customer_id',
             maintain_order=True,
         )
@@ -424,27 +364,15 @@ def total_by_customer(df: DataFrame, out: str) -> DataFrame:
             'quantity',
             col('total').round(2),
         )
-        .join(
-            customer,
-            left_on='customer_id',
-            right_on='id',
-        )
+        .pipe(gather, customer, 'customer_id')
         .sort('customer_id')
     )
-    export(new, out)
-    return new
-
-
-b2b_total_by_customer = total_by_customer(b2b, 'b2b/total_by_customer.csv')
-b2c_total_by_customer = total_by_customer(b2c, 'b2c/total_by_customer.csv')
 
 
-def total_by_store(df: DataFrame, out: str) -> DataFrame:
-    new = (
-        df.with_columns(
-            (col('quantity') * col('price')).alias('total'),
-        )
-        .groupby(
+@instrumented
+def total_by_store(df: Frame, store: DataFrame) -> Frame:
+    return (
+        df.groupby(
             'store_id',
             'customer_id',
             maintain_order=True,
@@ -462,16 +390,320 @@ def total_by_store(df: DataFrame, out: str) -> DataFrame:
             col('total').round(2),
             'customers',
         )
-        .join(
-            store,
-            left_on='store_id',
-            right_on='id',
-        )
+        .pipe(gather, store, 'store_id')
         .sort('store_id')
     )
-    export(new, out)
-    return new
 
 
-b2b_total_by_store = total_by_store(b2b, 'b2b/total_by_store.csv')
-b2c_total_by_store = total_by_store(b2c, 'b2c/total_by_store.csv')
+@instrumented
+def materialize(lazy: bool, streaming: bool, *dfs: Frame) -> list[Frame]:
+    if lazy:
+        return [
+            df.lazy()
+            for df in collect_all(
+                dfs,
+                common_subplan_elimination=not streaming,
+                streaming=streaming,
+            )
+        ]
+    return list(dfs)
+
+
+@instrumented
+def partials(streaming: bool) -> list[Frame]:
+    # orders never span partitions, so each is deduplicated and rolled up on its
+    # own, holding one partition at a time, and the rollups are summed after
+    parts = []
+    for path in partitions():
+        sales = materialize(True, streaming, dedup_sales([load(path, True)]))[0]
+        parts.append(
+            materialize(True, False, *(fn(sales) for fn, _ in PARTIALS.values()))
+        )
+    return [
+        concat(dfs).groupby(keys).sum()
+        for dfs, (_, keys) in zip(zip(*parts), PARTIALS.values())
+    ]
+
+
+def chunk_size(memory: int) -> int:
+    # rows per streaming batch, shared by every thread of the pool
+    sample = clean_sales(
+        [load(path, True).head(1000) for path in partitions()]
+    ).collect()
+    row = sample.estimated_size() / max(sample.height, 1)
+    return max(int(memory / (threadpool_size() * row)), 1000)
+
+
+def graph(
+    lazy: bool = False,
+    streaming: bool = False,
+    as_of: date | None = None,
+    thresholds: dict[str, float] = THRESHOLDS,
+) -> dict[str, Node]:
+    nodes = {
+        'data/customer': (
+            lambda: clean_customer(load('raw/customer.csv', lazy)),
+            [],
+        ),
+        'data/store': (
+            lambda: clean_store(load('raw/store.csv', lazy)),
+            [],
+        ),
+        'data/employee': (
+            lambda: clean_employee(load('raw/employee.csv', lazy)),
+            [],
+        ),
+        'data/product': (
+            lambda: clean_product(load('raw/product.csv', lazy)),
+            [],
+        ),
+        'customer_index': (index, ['data/customer']),
+        'store_index': (index, ['data/store']),
+        'product_index': (index, ['data/product']),
+        'b2c/customer_per_store': (
+            customer_per_store,
+            ['data/customer', 'store_index'],
+        ),
+        'sales': (
+            # deduplicated, sorted and re-identified as a whole, so the channel
+            # outputs and everything built on them hold every sale in memory;
+            # it is collected once in lazy mode too, as several stages read it
+            lambda: materialize(
+                lazy,
+                streaming,
+                clean_sales([load(path, lazy) for path in partitions()]),
+            )[0],
+            [],
+        ),
+        'state/classify': (
+            lambda periods: materialize(
+                lazy,
+                streaming,
+                decide(stats(periods), thresholds),
+            )[0],
+            ['periods'],
+        ),
+        'channels': (
+            lambda sales, decisions: materialize(
+                lazy,
+                streaming,
+                *(line_total(reid_sales(df)) for df in split(sales, decisions)),
+            ),
+            ['sales', 'state/classify'],
+        ),
+        'b2b': (itemgetter(0), ['channels']),
+        'b2c': (itemgetter(1), ['channels']),
+        'findings/non_retail': (non_retail, ['b2b']),
+        'state/rfm': (
+            lambda df: materialize(lazy, streaming, summarize(orders(df)))[0],
+            ['b2c'],
+        ),
+        'b2c/rfm': (lambda state: score(state, as_of), ['state/rfm']),
+        'b2c/segment': (segment, ['b2c/rfm']),
+        'b2c/segment_count': (segment_count, ['b2c/segment']),
+        'findings/staff': (facts, ['quarters', 'data/employee']),
+        'findings/finance': (finance, ['monthly', 'data/product']),
+        'cube/day': (
+            lambda b2b, b2c, *deps: materialize(
+                lazy, streaming, base(daily(b2b), daily(b2c), *deps)
+            )[0],
+            ['b2b', 'b2c', 'data/product', 'b2c/segment'],
+        ),
+    }
+    if streaming:
+        nodes['partials'] = (lambda: partials(streaming), [])
+        for i, name in enumerate(PARTIALS):
+            nodes[name] = (itemgetter(i), ['partials'])
+    else:
+        for name, (fn, _) in PARTIALS.items():
+            nodes[name] = (fn, ['sales'])
+    for channel in ('b2b', 'b2c'):
+        nodes |= {
+            f'{channel}/sales': (lambda df: df.drop('total'), [channel]),
+            f'{channel}/total_by_order': (total_by_order, [channel]),
+            f'{channel}/timeline': (
+                lambda df: materialize(lazy, streaming, timeline(hourly(df)))[0],
+                [f'{channel}/total_by_order'],
+            ),
+            f'{channel}/order_by_date': (
+                lambda df: at(df, 'day', 'date'),
+                [f'{channel}/timeline'],
+            ),
+            f'{channel}/order_by_month': (
+                lambda df: at(df, 'month'),
+                [f'{channel}/timeline'],
+            ),
+            f'{channel}/total_by_product': (
+                total_by_product,
+                [channel, 'product_index'],
+            ),
+            f'{channel}/total_by_customer': (
+                total_by_customer,
+                [channel, 'customer_index'],
+            ),
+            f'{channel}/total_by_store': (
+                total_by_store,
+                [channel, 'store_index'],
+            ),
+        }
+    for name, (grain, dims) in ROLLUPS.items():
+        if name != 'day':
+            nodes[f'cube/{name}'] = (
+                # the streaming engine miscounts groups on null categoricals,
+                # and rollups of the day cube are small anyway
+                lambda df, grain=grain, dims=dims: materialize(
+                    lazy, False, rollup(df, grain, dims)
+                )[0],
+                ['cube/day'],
+            )
+    return nodes
+
+
+def save(df: DataFrame, path: str, fmt: str, mode: str):
+    if path in PARTITIONED:
+        write_partitioned(df, path, mode)
+    else:
+        export(df, path, fmt, mode)
+
+
+def target(path: str, fmt: str) -> str:
+    return path if path in PARTITIONED else f'{path}.{fmt}'
+
+
+def exporting(fn: Callable[..., Frame], path: str, fmt: str, mode: str):
+    def node(*deps: Frame) -> Frame:
+        df = fn(*deps)
+        save(df, path, fmt, mode)
+        return df
+
+    return node
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument(
+        '--lazy',
+        action='store_true',
+        help='build every output as one lazy query graph and collect them together',
+    )
+    parser.add_argument(
+        '--format',
+        choices=FORMATS,
+        default='parquet',
+        help='storage format of the outputs',
+    )
+    parser.add_argument(
+        '--verify',
+        choices=('off', 'cheap', 'full'),
+        default=VERIFY,
+        help='how each output is checked after writing (full by default in CI)',
+    )
+    parser.add_argument(
+        '--jobs',
+        type=int,
+        help='number of stages built and written at the same time',
+    )
+    parser.add_argument(
+        '--streaming',
+        action='store_true',
+        help=(
+            'run the stages it supports on the streaming engine (implies --lazy); '
+            'classify, finance and staff hold one sales partition at a time, '
+            'the channel outputs still hold every sale'
+        ),
+    )
+    parser.add_argument(
+        '--memory',
+        type=int,
+        help='MiB per streaming batch; sets the chunk size, does not cap the run',
+    )
+    parser.add_argument(
+        '--as-of',
+        type=date.fromisoformat,
+        help='reference date for recency (default: the day after the last order)',
+    )
+    parser.add_argument(
+        '--trace',
+        metavar='PATH',
+        help='record time, cpu, rows, peak memory and bytes written per stage as JSON',
+    )
+    parser.add_argument(
+        '--plans',
+        action='store_true',
+        help='with --trace, also record the optimized plan of every lazy stage',
+    )
+    parser.add_argument(
+        '--profile-plans',
+        action='store_true',
+        help='with --trace, also run each lazy stage under the polars profiler',
+    )
+    parser.add_argument(
+        '--rule',
+        type=rule,
+        action='append',
+        help='classify a customer as b2b when NAME exceeds THRESHOLD (repeatable)',
+        metavar='NAME=THRESHOLD',
+    )
+    parser.add_argument(
+        '--force',
+        action='store_true',
+        help='rebuild every output even when its inputs and code are unchanged',
+    )
+    args = parser.parse_args()
+    args.lazy |= args.streaming
+    if args.trace:
+        enable(args.plans, args.profile_plans)
+    if args.streaming and args.memory:
+        Config.set_streaming_chunk_size(chunk_size(args.memory << 20))
+
+    thresholds = dict(args.rule) if args.rule else THRESHOLDS
+    nodes = graph(args.lazy, args.streaming, args.as_of, thresholds)
+    manifest = read_manifest()
+    prints = fingerprints(
+        nodes,
+        sources(),
+        manifest,
+        {
+            'state/classify': sorted(thresholds.items()),
+            'b2c/rfm': args.as_of,
+        },
+        save,
+    )
+    files = {name: target(name, args.format) for name in nodes if '/' in name}
+    outputs = list(files) if args.force else stale(files, prints, manifest)
+    nodes = needed(nodes, outputs)
+    # forgotten up front, so outputs half written by a failed run are rebuilt
+    for name in outputs:
+        manifest['outputs'].pop(name, None)
+    write_manifest(manifest)
+    if not args.lazy:
+        for name in outputs:
+            fn, deps = nodes[name]
+            nodes[name] = (exporting(fn, name, args.format, args.verify), deps)
+        run(nodes, args.jobs)
+    else:
+        frames = run(nodes, args.jobs)
+        frames = instrumented(collect_all)(
+            [frames[name] for name in outputs],
+            common_subplan_elimination=not args.streaming,
+            streaming=args.streaming,
+        )
+        with ThreadPoolExecutor(args.jobs) as pool:
+            list(
+                pool.map(
+                    lambda name, df: save(df, name, args.format, args.verify),
+                    outputs,
+                    frames,
+                )
+            )
+    for name in outputs:
+        record(manifest, name, files[name], prints[name])
+    write_manifest(manifest)
+    if args.trace:
+        write(args.trace)
+        with Config(tbl_rows=-1):
+            print(summary())
+
+
+if __name__ == '__main__':
+    main()
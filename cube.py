@@ -0,0 +1,152 @@
+from datetime import timedelta
+from functools import lru_cache
+from os.path import getmtime
+from typing import Any
+
+from polars import DataFrame, LazyFrame, col, concat, count, lit
+
+from instrument import instrumented
+from schema import compact
+from utils import locate, read
+
+Frame = DataFrame | LazyFrame
+DIMS = [
+    'channel',
+    'segment',
+    'store_id',
+    'staff_id',
+    'group',
+    'category',
+    'type',
+]
+MEASURES = ['quantity', 'total', 'lines']
+GRAINS = {
+    'day': col('date'),
+    'week': col('date').dt.truncate('1w'),
+    'month': col('date').dt.truncate('1mo'),
+    'quarter': col('date').dt.truncate('1q'),
+    'year': col('date').dt.truncate('1y'),
+}
+DERIVABLE = {
+    'day': set(GRAINS),
+    'month': {'month', 'quarter', 'year'},
+}
+# smallest first, so queries hit the coarsest rollup that can answer them
+ROLLUPS = {
+    'month_store': ('month', ['channel', 'segment', 'store_id']),
+    'month': ('month', DIMS),
+    'day': ('day', DIMS),
+}
+
+
+@instrumented
+def daily(lines: Frame) -> Frame:
+    # by customer, so the channel and segment can be joined after it is summed
+    return lines.groupby(
+        col('time').dt.date().alias('date'),
+        'customer_id',
+        'store_id',
+        'staff_id',
+        'product_id',
+    ).agg(
+        col('quantity', 'total').sum(),
+        count().alias('lines'),
+    )
+
+
+@instrumented
+def base(b2b: Frame, b2c: Frame, product: Frame, segment: Frame) -> Frame:
+    return (
+        concat(
+            [
+                b2b.with_columns(channel=lit('b2b')),
+                b2c.with_columns(channel=lit('b2c')),
+            ]
+        )
+        .join(
+            product.select(
+                col('id').alias('product_id'),
+                'group',
+                'category',
+                'type',
+            ),
+            on='product_id',
+            how='left',
+        )
+        .join(
+            segment.select('customer_id', 'segment'),
+            on='customer_id',
+            how='left',
+        )
+        .pipe(compact, 'cube/day')
+        .groupby('date', *DIMS)
+        .agg(col(MEASURES).sum())
+        .sort('date')
+    )
+
+
+@instrumented
+def rollup(df: Frame, grain: str, dims: list[str]) -> Frame:
+    return (
+        df.groupby(GRAINS[grain].alias('date'), *dims)
+        .agg(col(MEASURES).sum())
+        .sort('date')
+    )
+
+
+def version() -> tuple:
+    return tuple((name, getmtime(locate(f'cube/{name}'))) for name in ROLLUPS)
+
+
+@lru_cache(maxsize=2)
+def rollups(version: tuple) -> dict[str, DataFrame]:
+    return {name: read(f'cube/{name}') for name in ROLLUPS}
+
+
+def load() -> dict[str, DataFrame]:
+    return rollups(version())
+
+
+def months(value: Any) -> bool:
+    # month rows are dated on the 1st, so only whole months filter them exactly
+    if not isinstance(value, tuple):
+        return False
+    lo, hi = value
+    return lo.day == 1 and (hi + timedelta(days=1)).day == 1
+
+
+def query(
+    by: list[str] | None = None,
+    where: dict[str, Any] | None = None,
+    grain: str | None = None,
+) -> DataFrame:
+    by = by or []
+    where = where or {}
+    need = set(by) | set(where) - {'date'}
+    for name, (g, dims) in ROLLUPS.items():
+        if (
+            need <= set(dims)
+            and (grain is None or grain in DERIVABLE[g])
+            and ('date' not in where or g == 'day' or months(where['date']))
+        ):
+            break
+    else:
+        raise ValueError(f'no rollup covers {sorted(need)} at grain {grain}')
+
+    df = load()[name].lazy()
+    for dim, value in where.items():
+        if isinstance(value, tuple):
+            df = df.filter(col(dim).is_between(*value))
+        else:
+            df = df.filter(
+                col(dim).is_in(value if isinstance(value, list) else [value])
+            )
+    keys = [GRAINS[grain].alias('date'), *by] if grain else by
+    measures = [
+        col('quantity').sum(),
+        col('total').sum().round(2),
+        col('lines').sum(),
+    ]
+    if not keys:
+        return df.select(measures).collect()
+    return df.groupby(keys).agg(measures).sort(['date', *by] if grain else by).collect()
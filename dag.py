@@ -0,0 +1,22 @@
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable
+
+Node = tuple[Callable[..., Any], list[str]]
+
+
+def run(nodes: dict[str, Node], jobs: int | None = None) -> dict[str, Any]:
+    done = {}
+    pending = dict(nodes)
+    running = {}
+    with ThreadPoolExecutor(jobs) as pool:
+        while pending or running:
+            for name, (fn, deps) in list(pending.items()):
+                if all(d in done for d in deps):
+                    running[pool.submit(fn, *(done[d] for d in deps))] = name
+                    del pending[name]
+            if not running:
+                raise ValueError(f'unresolvable dependencies: {sorted(pending)}')
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                done[running.pop(future)] = future.result()
+    return done
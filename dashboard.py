@@ -1,15 +1,16 @@
 import numpy as np
-import pandas as pd
-import plotly.express as px
 import streamlit as st
 from folium import Icon, Map, Marker
 from plotly.graph_objects import Figure, Layout, layout
 from plotly.io import templates
-from polars import read_csv
 from streamlit import sidebar as sb
 from streamlit.delta_generator import DeltaGenerator
 from streamlit_folium import st_folium as map
 
+from loader import figure, load
+from timeline import GRAINS
+from utils import locate
+
 
 def dis(f: Figure, place: DeltaGenerator = st, rangeslider: bool = False):
     f = f.update_layout(
@@ -92,6 +93,7 @@ templates.default = 'custom+plotly_white'
 cf = sb.expander('Settings')
 nbins = cf.slider('Number of bins for histogram', 1, 1000, 50)
 curve = cf.checkbox('Curve for line chart', value=True)
+points = cf.slider('Point budget for large charts', 1000, 100000, 20000, 1000)
 
 page = sb.selectbox(
     'Select a page',
@@ -112,13 +114,14 @@ if page == 'Exploratory Data Analysis':
     )
 
     if view == 'Store':
-        total_by_store = read_csv('b2c/total_by_store.csv')
+        total_by_store = load('b2c/total_by_store')
 
         c1, c2 = st.columns(2)
         c1.subheader('Number of customer each store')
         dis(
-            px.pie(
-                total_by_store,
+            figure(
+                'pie',
+                'b2c/total_by_store',
                 values='customers',
                 hover_name='address',
             ),
@@ -126,8 +129,9 @@ if page == 'Exploratory Data Analysis':
         )
         c2.subheader('Sales each store')
         dis(
-            px.pie(
-                total_by_store,
+            figure(
+                'pie',
+                'b2c/total_by_store',
                 values='total',
                 hover_name='address',
             ),
@@ -181,70 +185,49 @@ if page == 'Exploratory Data Analysis':
 
     elif view == 'Time':
         st.header('Time')
-        order_by_date = read_csv('b2c/order_by_date.csv')
-        order_by_month = read_csv('b2c/order_by_month.csv')
-
         line_shape = 'spline' if curve else 'linear'
-        t1, t2 = st.tabs(['By date', 'By month'])
-
-        t1.subheader('Quantity sold by date')
-        dis(
-            px.line(
-                order_by_date,
-                x='date',
-                y='quantity',
-                height=700,
-                line_shape=line_shape,
-            ),
-            t1,
-            rangeslider=True,
-        )
-        t1.subheader('Sales by date')
-        dis(
-            px.line(
-                order_by_date,
-                x='date',
-                y='total',
-                height=700,
-                line_shape=line_shape,
-            ),
-            t1,
-            rangeslider=True,
-        )
-        t2.subheader('Quantity sold by month')
-        dis(
-            px.line(
-                order_by_month,
-                x='month',
-                y='quantity',
-                height=700,
-                line_shape=line_shape,
-            ),
-            t2,
-            rangeslider=True,
-        )
-        t2.subheader('Sales by month')
-        dis(
-            px.line(
-                order_by_month,
-                x='month',
-                y='total',
-                height=700,
-                line_shape=line_shape,
-            ),
-            t2,
-            rangeslider=True,
+        render_mode = 'svg' if curve else 'webgl'  # webgl has no spline
+        try:
+            locate('b2c/timeline')
+            tables = {g: ('b2c/timeline', g, 'period') for g in GRAINS}
+        except FileNotFoundError:
+            # outputs built before the timeline only hold daily and monthly totals
+            tables = {
+                'day': ('b2c/order_by_date', None, 'date'),
+                'month': ('b2c/order_by_month', None, 'month'),
+            }
+        grain = st.radio(
+            'Grain',
+            list(tables),
+            index=list(tables).index('day'),
+            horizontal=True,
         )
+        table, at, x = tables[grain]
+        for title, y in (('Quantity sold', 'quantity'), ('Sales', 'total')):
+            st.subheader(f'{title} by {grain}')
+            dis(
+                figure(
+                    'line',
+                    table,
+                    points=points,
+                    grain=at,
+                    render_mode=render_mode,
+                    x=x,
+                    y=y,
+                    height=700,
+                    line_shape=line_shape,
+                ),
+                rangeslider=True,
+            )
 
     elif view == 'Customer':
         st.header('Customer')
-        total_by_customer = read_csv('b2c/total_by_customer.csv')
-
         ex1 = st.expander('Sales distribution')
         ex1.subheader('Quantity sold')
         dis(
-            px.histogram(
-                total_by_customer,
+            figure(
+                'histogram',
+                'b2c/total_by_customer',
                 x='quantity',
                 marginal='box',
             ),
@@ -252,8 +235,9 @@ if page == 'Exploratory Data Analysis':
         )
         ex1.subheader('Sales')
         dis(
-            px.histogram(
-                total_by_customer,
+            figure(
+                'histogram',
+                'b2c/total_by_customer',
                 x='total',
                 marginal='box',
             ),
@@ -263,16 +247,18 @@ if page == 'Exploratory Data Analysis':
         ex2 = st.expander('Age & gender distribution')
         ex2.subheader('Gender distribution')
         dis(
-            px.pie(
-                total_by_customer,
+            figure(
+                'pie',
+                'b2c/total_by_customer',
                 names='gender',
             ),
             ex2,
         )
         ex2.subheader('Age distribution')
         dis(
-            px.histogram(
-                total_by_customer,
+            figure(
+                'histogram',
+                'b2c/total_by_customer',
                 x='age',
                 marginal='box',
             ),
@@ -282,8 +268,9 @@ if page == 'Exploratory Data Analysis':
         ex3 = st.expander('Relationships')
         ex3.subheader('Age & sales')
         dis(
-            px.bar(
-                total_by_customer,
+            figure(
+                'bar',
+                'b2c/total_by_customer',
                 x='age',
                 y='total',
                 color='gender',
@@ -292,8 +279,9 @@ if page == 'Exploratory Data Analysis':
         )
         ex3.subheader('Age & gender')
         dis(
-            px.violin(
-                total_by_customer,
+            figure(
+                'violin',
+                'b2c/total_by_customer',
                 x='gender',
                 y='age',
                 box=True,
@@ -303,13 +291,12 @@ if page == 'Exploratory Data Analysis':
 
     elif view == 'Product':
         st.header('Product')
-        total_by_product = read_csv('b2c/total_by_product.csv')
-
         ex1 = st.expander('Sales distribution')
         ex1.subheader('Quantity sold')
         dis(
-            px.histogram(
-                total_by_product,
+            figure(
+                'histogram',
+                'b2c/total_by_product',
                 x='quantity',
                 nbins=nbins,
                 marginal='box',
@@ -318,8 +305,9 @@ if page == 'Exploratory Data Analysis':
         )
         ex1.subheader('Sales')
         dis(
-            px.histogram(
-                total_by_product,
+            figure(
+                'histogram',
+                'b2c/total_by_product',
                 x='total',
                 nbins=nbins,
                 marginal='box',
@@ -330,32 +318,36 @@ if page == 'Exploratory Data Analysis':
         ex2 = st.expander('Product distribution')
         ex2.subheader('Group')
         dis(
-            px.pie(
-                total_by_product,
+            figure(
+                'pie',
+                'b2c/total_by_product',
                 names='group',
             ),
             ex2,
         )
         ex2.subheader('Category')
         dis(
-            px.pie(
-                total_by_product,
+            figure(
+                'pie',
+                'b2c/total_by_product',
                 names='category',
             ),
             ex2,
         )
         ex2.subheader('Type')
         dis(
-            px.pie(
-                total_by_product,
+            figure(
+                'pie',
+                'b2c/total_by_product',
                 names='type',
             ),
             ex2,
         )
         ex2.subheader('Tax exempt')
         dis(
-            px.pie(
-                total_by_product,
+            figure(
+                'pie',
+                'b2c/total_by_product',
                 names='is_tax_exempt',
             ),
             ex2,
@@ -364,8 +356,9 @@ if page == 'Exploratory Data Analysis':
         ex3 = st.expander('Relationships')
         ex3.subheader('Category & sales')
         dis(
-            px.bar(
-                total_by_product,
+            figure(
+                'bar',
+                'b2c/total_by_product',
                 x='group',
                 y='total',
                 color='category',
@@ -374,8 +367,9 @@ if page == 'Exploratory Data Analysis':
         )
         ex3.subheader('Unit cost & sales')
         dis(
-            px.histogram(
-                total_by_product,
+            figure(
+                'histogram',
+                'b2c/total_by_product',
                 x='cost',
                 y='total',
                 color='group',
@@ -396,32 +390,31 @@ elif page == 'RFM Analysis':
     )
     if view == 'Segmentation Map':
         st.subheader('Customer Segmentation Map by RFM scores')
-
-        segment_count = read_csv('b2c/segment_count.csv')
-
         dis(
-            px.treemap(
-                segment_count,
+            figure(
+                'treemap',
+                'b2c/segment_count',
                 path=['segment'],
                 values='count',
                 height=600,
             )
         )
         dis(
-            px.pie(
-                segment_count,
+            figure(
+                'pie',
+                'b2c/segment_count',
                 values='count',
                 names='segment',
             )
         )
     if view == 'Segment Analysis':
         st.header('Segment Analysis by RFM scores')
-
-        rfm = pd.read_csv('b2c/segment.csv')
         st.subheader('All 3 metrics w.r.t each other')
         dis(
-            px.scatter_3d(
-                rfm,
+            figure(
+                'scatter_3d',
+                'b2c/segment',
+                points=points,
                 x='recency',
                 y='frequency',
                 z='monetary',
@@ -433,8 +426,11 @@ elif page == 'RFM Analysis':
         )
         st.subheader('Recency w.r.t Frequency')
         dis(
-            px.scatter(
-                rfm,
+            figure(
+                'scatter',
+                'b2c/segment',
+                points=points,
+                render_mode='webgl',
                 x='recency',
                 y='frequency',
                 color='segment',
@@ -448,8 +444,10 @@ elif page == 'RFM Analysis':
         ]:
             st.subheader(f'Distribution of {i.capitalize()} on each segment')
             dis(
-                px.box(
-                    rfm,
+                figure(
+                    'box',
+                    'b2c/segment',
+                    points=points,
                     x=i,
                     y='segment',
                     height=700,
@@ -0,0 +1,34 @@
+from polars import DataFrame, LazyFrame, UInt32, arange, col, lit
+
+Frame = DataFrame | LazyFrame
+KEY = 'id'
+FOUND = '_found'
+
+
+def index(dim: Frame, key: str = KEY) -> DataFrame:
+    # row i holds the member with id i, so lookups are positional
+    dim = dim.lazy().collect()
+    return (
+        DataFrame({key: arange(0, dim[key].max() + 1, eager=True).cast(dim[key].dtype)})
+        .join(
+            dim.with_columns(lit(True).alias(FOUND)),
+            on=key,
+            how='left',
+        )
+        .drop(key)
+    )
+
+
+def gather(fact: Frame, index: DataFrame, on: str) -> Frame:
+    # same rows and columns as an inner join of fact[on] against the dimension id
+    inside = col(on).is_between(0, index.height - 1).fill_null(False)
+    if isinstance(fact, LazyFrame):
+        return (
+            fact.filter(inside)
+            .with_columns(lit(index[c]).take(col(on)).alias(c) for c in index.columns)
+            .filter(col(FOUND))
+            .drop(FOUND)
+        )
+    if not fact.select(inside.all()).item():
+        fact = fact.filter(inside)
+    return fact.hstack(index[fact[on].cast(UInt32)]).filter(col(FOUND)).drop(FOUND)
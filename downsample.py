@@ -0,0 +1,34 @@
+import numpy as np
+from polars import DataFrame, Float64
+
+
+def lttb(df: DataFrame, x: str, y: str, n: int) -> DataFrame:
+    if df.height <= n or n < 3:
+        return df
+    df = df.sort(x)
+    xs = df[x].to_physical().cast(Float64).to_numpy()
+    ys = df[y].cast(Float64).to_numpy()
+    edges = np.linspace(1, df.height - 1, n - 1).astype(int)
+    edges = np.append(edges, df.height)
+    keep = [0]
+    for i in range(n - 2):
+        lo, hi = edges[i], edges[i + 1]
+        ax, ay = xs[keep[-1]], ys[keep[-1]]
+        bx, by = xs[hi : edges[i + 2]].mean(), ys[hi : edges[i + 2]].mean()
+        area = np.abs((ax - bx) * (ys[lo:hi] - ay) - (ax - xs[lo:hi]) * (by - ay))
+        keep.append(int(lo + area.argmax()))
+    keep.append(df.height - 1)
+    return df[keep]
+
+
+def stratified(
+    df: DataFrame, n: int, by: str | None = None, seed: int = 0
+) -> DataFrame:
+    if df.height <= n:
+        return df
+    frac = n / df.height
+    if by is None:
+        return df.sample(fraction=frac, seed=seed)
+    return df.groupby(by, maintain_order=True).apply(
+        lambda g: g.sample(max(1, round(g.height * frac)), seed=seed)
+    )
@@ -0,0 +1,80 @@
+from argparse import ArgumentParser
+from datetime import date
+
+from polars import Config, DataFrame, LazyFrame, col, count
+
+from instrument import instrumented
+from utils import read
+
+Frame = DataFrame | LazyFrame
+STORE = 'findings/finance'
+PERIOD = '1mo'
+WINDOW = '6mo'
+
+
+@instrumented
+def monthly(lines: Frame) -> Frame:
+    return lines.groupby(
+        'store_id',
+        col('time').dt.truncate(PERIOD).dt.date().alias('month'),
+        'product_id',
+    ).agg(
+        col('quantity', 'total').sum(),
+    )
+
+
+@instrumented
+def finance(monthly: Frame, product: Frame, window: str = WINDOW) -> Frame:
+    # costed after the monthly rollup, so the product lookup touches one row
+    # per store, month and product instead of every line item
+    return (
+        monthly.join(
+            product.select(col('id').alias('product_id'), 'cost'),
+            on='product_id',
+            how='left',
+        )
+        .groupby('store_id', 'month')
+        .agg(
+            col('total').sum().alias('revenue'),
+            (col('quantity') * col('cost')).sum().alias('cost'),
+        )
+        .sort('store_id', 'month')
+        .groupby_rolling('month', period=window, by='store_id')
+        .agg(
+            col('revenue', 'cost').sum(),
+            count().alias('months'),
+        )
+        .with_columns(
+            (col('revenue') - col('cost')).alias('profit'),
+        )
+        .with_columns(
+            (col('profit') / col('revenue')).alias('margin'),
+            (col('revenue') / col('revenue').sum().over('month')).alias('contribution'),
+            (col('profit') / col('profit').sum().over('month')).alias(
+                'profit_contribution'
+            ),
+        )
+        .with_columns(
+            col('revenue', 'cost', 'profit').round(2),
+        )
+        .sort('month', 'store_id')
+    )
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument(
+        '--month',
+        type=date.fromisoformat,
+        help='first day of the last month in the window (latest by default)',
+    )
+    args = parser.parse_args()
+
+    df = read(STORE)
+    month = args.month or df['month'].max()
+    with Config(tbl_rows=-1, tbl_cols=-1, tbl_width_chars=160):
+        print(df.filter(col('month') == month))
+
+
+if __name__ == '__main__':
+    main()
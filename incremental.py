@@ -0,0 +1,335 @@
+from argparse import ArgumentParser
+from datetime import date
+from glob import glob
+from json import dump
+from json import load as load_json
+from os import makedirs, remove, rename
+from os.path import basename, dirname, exists, getmtime, isdir, join, splitext
+from shutil import rmtree
+from typing import Any
+
+from polars import INTEGER_DTYPES, DataFrame, Int64, col, concat, read_parquet
+
+from cache import digest
+from classify import STORE as DECISIONS
+from classify import THRESHOLDS, decide, describe, periods, rule, stats
+from clean import (
+    clean_customer,
+    clean_employee,
+    clean_product,
+    clean_sales,
+    clean_store,
+    line_total,
+    load,
+    partitions,
+    total_by_customer,
+    total_by_product,
+    total_by_store,
+)
+from cube import ROLLUPS, base, daily, rollup
+from dims import index
+from finance import STORE as FINANCE
+from finance import finance, monthly
+from rfm import fold, orders, score, summarize
+from schema import IDS, conform
+from segment import segment, segment_count
+from staff import STORE as STAFF
+from staff import facts, quarters
+from timeline import at, hourly, timeline
+from utils import export, read
+
+STATE = 'state'
+MANIFEST = join(STATE, 'manifest.json')
+MERGED = join(STATE, 'merged')
+SOURCES = join(MERGED, 'sources.json')
+DONE = join(STATE, 'done.json')
+# summed partials, so a partition's contribution can be subtracted again
+KEYS = {
+    'by_hour': ['customer_id', 'time'],
+    'by_product': ['customer_id', 'product_id'],
+    'by_store': ['store_id', 'customer_id'],
+    'by_month': ['store_id', 'month', 'product_id'],
+    'periods': ['customer_id', 'period'],
+    'by_day': ['date', 'customer_id', 'store_id', 'staff_id', 'product_id'],
+    'by_quarter': ['staff_id', 'quarter'],
+}
+# a count that is positive on every row, quantity unless listed here
+COUNTS = {'by_quarter': 'lines'}
+PARTIALS = ['customer_days', *KEYS]
+
+
+def load_json_file(path: str, default: Any) -> Any:
+    if not exists(path):
+        return default
+    with open(path) as f:
+        return load_json(f)
+
+
+def save_json(path: str, o: Any):
+    makedirs(dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        dump(o, f, indent=2)
+
+
+def state_dir(path: str, h: str | None = None) -> str:
+    d = join(STATE, splitext(basename(path))[0])
+    return join(d, h[:16]) if h else d
+
+
+def discover(manifest: dict) -> dict[str, str]:
+    hashes = {}
+    for path in partitions():
+        mtime = getmtime(path)
+        entry = manifest.get(path)
+        if not entry or entry['mtime'] != mtime:
+            entry = manifest[path] = {'mtime': mtime, 'hash': digest(path)}
+        hashes[path] = entry['hash']
+    for path in [path for path in manifest if path not in hashes]:
+        del manifest[path]
+    return hashes
+
+
+def partials(sales: DataFrame) -> dict[str, DataFrame]:
+    lines = line_total(sales)
+    baskets = orders(lines)
+    return {
+        'customer_days': summarize(baskets),
+        'by_hour': hourly(baskets, 'customer_id'),
+        'by_product': lines.groupby(*KEYS['by_product']).agg(
+            col('quantity', 'total').sum(),
+        ),
+        'by_store': lines.groupby(*KEYS['by_store']).agg(
+            col('quantity', 'total').sum(),
+        ),
+        'by_month': monthly(lines),
+        'periods': periods(sales),
+        'by_day': daily(lines),
+        'by_quarter': quarters(sales),
+    }
+
+
+def stored(
+    path: str,
+    h: str,
+    names: list[str] = PARTIALS,
+) -> dict[str, DataFrame] | None:
+    d = state_dir(path, h)
+    if not all(exists(join(d, f'{name}.parquet')) for name in PARTIALS):
+        return None
+    return {
+        name: conform(read_parquet(join(d, f'{name}.parquet')), IDS) for name in names
+    }
+
+
+def partition(path: str, h: str) -> dict[str, DataFrame]:
+    parts = stored(path, h)
+    if parts is None:
+        parts = partials(clean_sales([load(path, False)]))
+        d = state_dir(path, h)
+        makedirs(d, exist_ok=True)
+        for name, df in parts.items():
+            df.write_parquet(join(d, f'{name}.parquet'))
+    return parts
+
+
+def signed(df: DataFrame, keys: list[str], sign: int = 1) -> DataFrame:
+    return df.with_columns(
+        (
+            sign * col(c).cast(Int64)
+            if df[c].dtype in INTEGER_DTYPES
+            else sign * col(c)
+        ).alias(c)
+        for c in df.columns
+        if c not in keys
+    )
+
+
+def merge(parts: list[dict[str, DataFrame]]) -> dict[str, DataFrame]:
+    return update(None, [], parts)
+
+
+def update(
+    merged: dict[str, DataFrame] | None,
+    old: list[dict[str, DataFrame]],
+    new: list[dict[str, DataFrame]],
+) -> dict[str, DataFrame]:
+    out = {
+        name: concat(
+            [
+                *([merged[name]] if merged else []),
+                *(signed(p[name], keys, -1) for p in old),
+                *(signed(p[name], keys) for p in new),
+            ]
+        )
+        .groupby(*keys)
+        .sum()
+        # zero means nothing is left
+        .filter(col(COUNTS.get(name, 'quantity')) != 0)
+        for name, keys in KEYS.items()
+    }
+    # first and last seen can't be subtracted, only folded again
+    out['customer_days'] = fold(
+        *([merged['customer_days']] if merged else []),
+        *(p['customer_days'] for p in new),
+    )
+    return out
+
+
+def load_sources() -> dict[str, str]:
+    # empty unless every partial was saved, so an incomplete state is rebuilt
+    if not all(exists(join(MERGED, f'{name}.parquet')) for name in PARTIALS):
+        return {}
+    return load_json_file(SOURCES, {})
+
+
+def load_merged() -> dict[str, DataFrame]:
+    return {
+        name: conform(read_parquet(join(MERGED, f'{name}.parquet')), IDS)
+        for name in PARTIALS
+    }
+
+
+def save_merged(merged: dict[str, DataFrame], sources: dict[str, str]):
+    # written aside and swapped in, so the state always matches its sources
+    tmp = f'{MERGED}.tmp'
+    rmtree(tmp, ignore_errors=True)
+    makedirs(tmp)
+    for name, df in merged.items():
+        df.write_parquet(join(tmp, f'{name}.parquet'))
+    save_json(join(tmp, 'sources.json'), sources)
+    rmtree(MERGED, ignore_errors=True)
+    rename(tmp, MERGED)
+
+
+def prune(hashes: dict[str, str], removed: list[str]):
+    for path in removed:
+        rmtree(state_dir(path), ignore_errors=True)
+    for path, h in hashes.items():
+        keep = basename(state_dir(path, h))
+        for entry in glob(join(state_dir(path), '*')):
+            if basename(entry) != keep:
+                (rmtree if isdir(entry) else remove)(entry)
+
+
+def refresh(
+    fmt: str = 'parquet',
+    as_of: date | None = None,
+    thresholds: dict[str, float] = THRESHOLDS,
+) -> list[str]:
+    manifest = load_json_file(MANIFEST, {})
+    hashes = discover(manifest)
+    save_json(MANIFEST, manifest)
+    sources = load_sources()
+    changed = [path for path, h in hashes.items() if sources.get(path) != h]
+    removed = [path for path in sources if path not in hashes]
+    done = {
+        'sources': hashes,
+        'rules': describe(thresholds),
+        'as_of': as_of and as_of.isoformat(),
+    }
+    if not changed and not removed and load_json_file(DONE, None) == done:
+        return []
+
+    # read only now, as the partials are about as large as the sales
+    merged = load_merged() if sources else None
+    if changed or removed:
+        old = [
+            stored(path, sources[path]) for path in changed + removed if path in sources
+        ]
+        new = [partition(path, hashes[path]) for path in changed]
+        if merged is None or any(p is None for p in old):
+            merged = merge([partition(path, h) for path, h in hashes.items()])
+        elif old:
+            merged = update(merged, old, new)
+            # customers touched by the old partitions are folded from scratch
+            merged['customer_days'] = fold(
+                *(
+                    stored(path, h, ['customer_days'])['customer_days']
+                    for path, h in hashes.items()
+                )
+            )
+        else:
+            merged = update(merged, [], new)
+        save_merged(merged, hashes)
+        prune(hashes, removed)
+    try:
+        cached = read(DECISIONS)
+    except FileNotFoundError:
+        cached = None
+    customer = index(clean_customer(load('raw/customer.csv', False)))
+    store = index(clean_store(load('raw/store.csv', False)))
+    product = clean_product(load('raw/product.csv', False))
+    employee = clean_employee(load('raw/employee.csv', False))
+    decisions = decide(stats(merged['periods']), thresholds, cached)
+    non_retail = decisions.filter(col('b2b')).select('customer_id')
+
+    outputs = {
+        DECISIONS: decisions,
+        FINANCE: finance(merged['by_month'], product),
+        STAFF: facts(merged['by_quarter'], employee),
+    }
+    days = {}
+    for channel, how in (('b2b', 'semi'), ('b2c', 'anti')):
+        pick = {
+            name: df.join(non_retail, on='customer_id', how=how)
+            for name, df in merged.items()
+            if 'customer_id' in df.columns
+        }
+        days[channel] = pick['by_day']
+        times = timeline(pick['by_hour'])
+        outputs |= {
+            f'{channel}/timeline': times,
+            f'{channel}/order_by_date': at(times, 'day', 'date'),
+            f'{channel}/order_by_month': at(times, 'month'),
+            f'{channel}/total_by_product': total_by_product(
+                pick['by_product'], index(product)
+            ),
+            f'{channel}/total_by_customer': total_by_customer(
+                pick['by_store'], customer
+            ),
+            f'{channel}/total_by_store': total_by_store(pick['by_store'], store),
+        }
+        if channel == 'b2b':
+            outputs['findings/non_retail'] = (
+                pick['customer_days']
+                .groupby('customer_id')
+                .agg(col('orders').sum().alias('count'))
+                .sort('customer_id')
+            )
+        else:
+            outputs['state/rfm'] = pick['customer_days']
+            outputs['b2c/rfm'] = score(pick['customer_days'], as_of)
+            outputs['b2c/segment'] = segment(outputs['b2c/rfm'])
+            outputs['b2c/segment_count'] = segment_count(outputs['b2c/segment'])
+    outputs['cube/day'] = base(
+        days['b2b'], days['b2c'], product, outputs['b2c/segment']
+    )
+    for name, (grain, dims) in ROLLUPS.items():
+        if name != 'day':
+            outputs[f'cube/{name}'] = rollup(outputs['cube/day'], grain, dims)
+    for path, df in outputs.items():
+        export(df, path, fmt)
+    # only now, so a run that fails before every output is written gets redone
+    save_json(DONE, done)
+    return changed
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument(
+        '--as-of',
+        type=date.fromisoformat,
+        help='reference date for recency (default: the day after the last order)',
+    )
+    parser.add_argument(
+        '--rule',
+        type=rule,
+        action='append',
+        help='classify a customer as b2b when NAME exceeds THRESHOLD (repeatable)',
+        metavar='NAME=THRESHOLD',
+    )
+    args = parser.parse_args()
+    refresh(
+        as_of=args.as_of,
+        thresholds=dict(args.rule) if args.rule else THRESHOLDS,
+    )
@@ -0,0 +1,149 @@
+from contextlib import contextmanager
+from functools import wraps
+from json import dump
+from os import sysconf, walk
+from os.path import getsize, isdir, join
+from threading import Event, Lock, Thread, local
+from time import perf_counter, process_time
+from typing import Any, Callable, Iterator
+
+from polars import DataFrame, LazyFrame, col, count
+from polars.exceptions import ComputeError
+
+PAGE = sysconf('SC_PAGE_SIZE')
+INTERVAL = 0.01
+OPTIONS = {
+    'enabled': False,
+    'plan': False,
+    'profile': False,
+}
+RECORDS: list[dict[str, Any]] = []
+LOCK = Lock()
+STACK = local()
+
+
+def enable(plan: bool = False, profile: bool = False):
+    OPTIONS.update(enabled=True, plan=plan, profile=profile)
+
+
+def rss() -> int:
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * PAGE
+
+
+def size(path: str) -> int:
+    if not isdir(path):
+        return getsize(path)
+    return sum(getsize(join(d, f)) for d, _, files in walk(path) for f in files)
+
+
+def unpack(*objs: Any) -> list[DataFrame | LazyFrame]:
+    return [
+        df
+        for o in objs
+        for df in (o if isinstance(o, (list, tuple)) else [o])
+        if isinstance(df, (DataFrame, LazyFrame))
+    ]
+
+
+def rows(*objs: Any) -> int | None:
+    found = unpack(*objs)
+    if not found or any(isinstance(df, LazyFrame) for df in found):
+        return None
+    return sum(df.height for df in found)
+
+
+@contextmanager
+def measure(stage: str) -> Iterator[dict[str, Any]]:
+    record = {'stage': stage}
+    base = peak = rss()
+    stop = Event()
+
+    def sample():
+        nonlocal peak
+        while not stop.wait(INTERVAL):
+            peak = max(peak, rss())
+
+    sampler = Thread(target=sample, daemon=True)
+    sampler.start()
+    STACK.records = [*getattr(STACK, 'records', []), record]
+    wall, cpu = perf_counter(), process_time()
+    try:
+        yield record
+    finally:
+        record['wall'] = perf_counter() - wall
+        record['cpu'] = process_time() - cpu
+        stop.set()
+        sampler.join()
+        peak = max(peak, rss())
+        record['peak_rss'] = peak
+        record['rss_delta'] = peak - base
+        STACK.records = STACK.records[:-1]
+        with LOCK:
+            RECORDS.append(record)
+
+
+def note(**fields: Any):
+    if OPTIONS['enabled'] and getattr(STACK, 'records', None):
+        STACK.records[-1].update(fields)
+
+
+def profile(df: LazyFrame) -> list[dict[str, Any]]:
+    # runs the stage's query once more, on top of the real run
+    try:
+        return df.profile()[1].to_dicts()
+    except ComputeError:  # in-memory frames have nothing to time
+        return []
+
+
+def instrumented(fn: Callable[..., Any]) -> Callable[..., Any]:
+    @wraps(fn)
+    def stage(*args: Any, **kwargs: Any) -> Any:
+        if not OPTIONS['enabled']:
+            return fn(*args, **kwargs)
+        with measure(fn.__name__) as record:
+            record['rows_in'] = rows(*args, *kwargs.values())
+            out = fn(*args, **kwargs)
+            record['rows_out'] = rows(out)
+            lazy = [df for df in unpack(out) if isinstance(df, LazyFrame)]
+            if OPTIONS['plan'] and lazy:
+                record['plan'] = '\n\n'.join(df.explain() for df in lazy)
+            if OPTIONS['profile'] and lazy:
+                record['profile'] = [profile(df) for df in lazy]
+        return out
+
+    return stage
+
+
+def frame() -> DataFrame:
+    with LOCK:
+        return DataFrame(
+            [
+                {k: v for k, v in r.items() if k not in ('plan', 'profile')}
+                for r in RECORDS
+            ],
+            infer_schema_length=None,
+        )
+
+
+def summary() -> DataFrame:
+    df = frame()
+    if df.is_empty():
+        return df
+    sums = [
+        c for c in ('wall', 'cpu', 'rows_in', 'rows_out', 'bytes') if c in df.columns
+    ]
+    return (
+        df.groupby('stage')
+        .agg(
+            count().alias('calls'),
+            col(sums).sum(),
+            col('peak_rss').max(),
+        )
+        .sort('wall', descending=True)
+    )
+
+
+def write(path: str):
+    with LOCK, open(path, 'w') as f:
+        dump(RECORDS, f, indent=2, default=str)
@@ -0,0 +1,51 @@
+from os.path import getmtime
+
+import plotly.express as px
+import streamlit as st
+from plotly.graph_objects import Figure
+from polars import DataFrame, col
+
+from downsample import lttb, stratified
+from schema import compact
+from utils import FORMATS, locate
+
+
+@st.cache_resource(max_entries=32)
+def cached(file: str, mtime: float) -> DataFrame:
+    path, fmt = file.rsplit('.', 1)
+    return compact(FORMATS[fmt][1](file), path)
+
+
+def load(path: str) -> DataFrame:
+    file = locate(path)
+    return cached(file, getmtime(file))
+
+
+@st.cache_data(max_entries=256)
+def plot(
+    kind: str,
+    file: str,
+    mtime: float,
+    points: int | None = None,
+    grain: str | None = None,
+    **kwargs,
+) -> Figure:
+    df = cached(file, mtime)
+    if grain:
+        df = df.filter(col('grain') == grain)
+    if points and kind == 'line':
+        df = lttb(df, kwargs['x'], kwargs['y'], points)
+    elif points:
+        df = stratified(df, points, kwargs.get('color'))
+    return getattr(px, kind)(df.to_pandas(), **kwargs)
+
+
+def figure(
+    kind: str,
+    table: str,
+    points: int | None = None,
+    grain: str | None = None,
+    **kwargs,
+) -> Figure:
+    file = locate(table)
+    return plot(kind, file, getmtime(file), points, grain, **kwargs)
@@ -0,0 +1,86 @@
+from datetime import date, datetime, timedelta
+from glob import glob
+from os import remove
+from shutil import rmtree
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+from polars import DataFrame, LazyFrame, col, count, scan_pyarrow_dataset
+
+from instrument import instrumented, note, size
+from utils import VERIFY
+
+KEYS = {
+    'year': pa.int32(),
+    'month': pa.uint32(),
+    'store': pa.int16(),
+}
+PARTITIONING = ds.partitioning(pa.schema(list(KEYS.items())), flavor='hive')
+
+
+@instrumented
+def write_partitioned(df: DataFrame, path: str, mode: str = VERIFY):
+    rmtree(path, ignore_errors=True)
+    for file in glob(f'{path}.*'):
+        remove(file)
+    ds.write_dataset(
+        df.with_columns(
+            col('time').dt.year().alias('year'),
+            col('time').dt.month().alias('month'),
+            col('store_id').alias('store'),
+        ).to_arrow(),
+        path,
+        format='parquet',
+        partitioning=PARTITIONING,
+    )
+    note(bytes=size(path))
+    verify(df, path, mode)
+
+
+def prune(
+    start: date | None,
+    end: date | None,
+    stores: list[int] | None,
+) -> list[ds.Expression]:
+    # rows with start <= time < end, so a month is (first day, first of next)
+    year, month, time = ds.field('year'), ds.field('month'), ds.field('time')
+    conds = []
+    if start:
+        conds += [
+            (year > start.year) | ((year == start.year) & (month >= start.month)),
+            time >= pa.scalar(datetime(start.year, start.month, start.day)),
+        ]
+    if end:
+        last = end - timedelta(days=1)
+        conds += [
+            (year < last.year) | ((year == last.year) & (month <= last.month)),
+            time < pa.scalar(datetime(end.year, end.month, end.day)),
+        ]
+    if stores:
+        conds.append(ds.field('store').isin(stores))
+    return conds
+
+
+def scan_partitioned(
+    path: str,
+    start: date | None = None,
+    end: date | None = None,
+    stores: list[int] | None = None,
+    keys: bool = False,
+) -> LazyFrame:
+    source = ds.dataset(path, format='parquet', partitioning=PARTITIONING)
+    columns = [name for name in source.schema.names if keys or name not in KEYS]
+    for cond in prune(start, end, stores):
+        source = source.filter(cond)
+    return scan_pyarrow_dataset(source).select(columns)
+
+
+def verify(df: DataFrame, path: str, mode: str = VERIFY):
+    if mode == 'off':
+        return
+    lf = scan_partitioned(path)
+    assert lf.schema == df.schema
+    if mode == 'full':
+        assert lf.collect().sort(df.columns).frame_equal(df.sort(df.columns))
+        return
+    assert lf.select(count()).collect().item() == df.height
@@ -0,0 +1,100 @@
+from argparse import ArgumentParser
+from datetime import date, timedelta
+
+from polars import DataFrame, LazyFrame, col, concat, count, lit
+
+from instrument import instrumented
+from segment import segment, segment_count
+from utils import export, read
+
+Frame = DataFrame | LazyFrame
+STORE = 'state/rfm'
+
+
+@instrumented
+def orders(lines: Frame) -> Frame:
+    return lines.groupby(
+        'time',
+        'id',
+        'store_id',
+        'staff_id',
+        'customer_id',
+    ).agg(
+        col('quantity').sum(),
+        col('total').sum().round(2),
+        count().alias('lines'),
+    )
+
+
+@instrumented
+def summarize(orders: Frame) -> Frame:
+    # one row per customer and day, so recency can be scored as of any earlier date
+    return orders.groupby('customer_id', col('time').dt.date().alias('day')).agg(
+        col('time').min().alias('first_seen'),
+        col('time').max().alias('last_seen'),
+        col('lines').sum().alias('frequency'),
+        (col('total') * col('lines')).sum().alias('monetary'),
+        count().alias('orders'),
+    )
+
+
+def fold(*states: Frame) -> Frame:
+    return (
+        concat(states)
+        .groupby('customer_id', 'day')
+        .agg(
+            col('first_seen').min(),
+            col('last_seen').max(),
+            col('frequency', 'monetary', 'orders').sum(),
+        )
+    )
+
+
+def latest(state: Frame) -> date:
+    last = state.lazy().select(col('last_seen').max()).collect().item()
+    return last.date() + timedelta(days=1)
+
+
+@instrumented
+def score(state: Frame, as_of: date | None = None) -> Frame:
+    if as_of is None:
+        as_of = latest(state)
+    return (
+        state.filter(col('day') <= as_of)
+        .groupby('customer_id')
+        .agg(
+            col('first_seen').min(),
+            col('last_seen').max(),
+            col('frequency', 'monetary').sum(),
+        )
+        .sort(
+            ['frequency', 'first_seen'],
+            descending=[True, False],
+        )
+        .select(
+            'customer_id',
+            (lit(as_of) - col('last_seen')).dt.days().alias('recency'),
+            'frequency',
+            col('monetary').round(2),
+        )
+    )
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument(
+        '--as-of',
+        type=date.fromisoformat,
+        help='reference date for recency (default: the day after the last order)',
+    )
+    args = parser.parse_args()
+
+    rfm = score(read(STORE), args.as_of)
+    seg = segment(rfm)
+    export(rfm, 'b2c/rfm')
+    export(seg, 'b2c/segment')
+    export(segment_count(seg), 'b2c/segment_count')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+from polars import (
+    Categorical,
+    DataFrame,
+    Int16,
+    Int32,
+    LazyFrame,
+    UInt32,
+    col,
+    enable_string_cache,
+)
+
+Frame = DataFrame | LazyFrame
+# categoricals built by different stages and files compare and join by value
+enable_string_cache(True)
+
+IDS = {
+    'store_id': Int16,
+    'staff_id': Int16,
+    'customer_id': Int32,
+    'product_id': Int16,
+}
+SALES = {**IDS, 'quantity': Int16}
+DIMS = {
+    'channel': Categorical,
+    'segment': Categorical,
+    'store_id': Int16,
+    'staff_id': Int16,
+    'group': Categorical,
+    'category': Categorical,
+    'type': Categorical,
+}
+SCHEMAS = {
+    'data/customer': {
+        'id': Int32,
+        'store': Int16,
+        'gender': Categorical,
+        'age': Int16,
+    },
+    'data/store': {
+        'id': Int16,
+        'type': Categorical,
+        'square_feet': Int32,
+        'address': Categorical,
+        # nullable, and min and max of an Int16 with nulls return its bounds
+        'manager': Int32,
+    },
+    'data/employee': {
+        'id': Int16,
+        'position': Categorical,
+    },
+    'data/product': {
+        'id': Int16,
+        'group': Categorical,
+        'category': Categorical,
+        'type': Categorical,
+        'unit': Categorical,
+    },
+    'sales': {'id': Int32, **SALES},
+    'b2b/sales': {'id': UInt32, **SALES},
+    'b2c/sales': {'id': UInt32, **SALES},
+    'cube/day': DIMS,
+    'cube/month': DIMS,
+    'cube/month_store': DIMS,
+}
+
+
+def conform(df: Frame, dtypes: dict) -> Frame:
+    return df.with_columns(
+        (
+            # cast again, as lazy schemas otherwise report set_ordering as boolean
+            col(name).cast(dtype).cat.set_ordering('lexical').cast(dtype)
+            if dtype == Categorical
+            else col(name).cast(dtype)
+        )
+        for name, dtype in dtypes.items()
+        if name in df.columns
+    )
+
+
+def compact(df: Frame, table: str) -> Frame:
+    return conform(df, SCHEMAS.get(table, IDS))
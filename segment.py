@@ -1,44 +1,79 @@
-import pandas as pd
+from polars import DataFrame, Expr, LazyFrame, UInt8, Utf8, col, concat_str
 
-df = pd.read_csv('b2c/rfm.csv')
+from instrument import instrumented
+from utils import export, read
 
-df['R'] = pd.qcut(
-    df['recency'].rank(method='first'),
-    5,
-    labels=[5, 4, 3, 2, 1],
+Frame = DataFrame | LazyFrame
+# rows are R = 1..5, columns are F = 1..5
+GRID = [
+    ['hibernating', 'hibernating', 'at_Risk', 'at_Risk', 'cant_loose'],
+    ['hibernating', 'hibernating', 'at_Risk', 'at_Risk', 'cant_loose'],
+    [
+        'about_to_sleep',
+        'about_to_sleep',
+        'need_attention',
+        'loyal_customers',
+        'loyal_customers',
+    ],
+    [
+        'promising',
+        'potential_loyalists',
+        'potential_loyalists',
+        'loyal_customers',
+        'loyal_customers',
+    ],
+    [
+        'new_customers',
+        'potential_loyalists',
+        'potential_loyalists',
+        'champions',
+        'champions',
+    ],
+]
+SEGMENTS = DataFrame(
+    {
+        'R': [r for r in range(1, 6) for _ in range(5)],
+        'F': [f for _ in range(5) for f in range(1, 6)],
+        'segment': [s for row in GRID for s in row],
+    },
+    schema={'R': UInt8, 'F': UInt8, 'segment': Utf8},
 )
-df['F'] = pd.qcut(
-    df['frequency'],
-    5,
-    labels=[1, 2, 3, 4, 5],
-)
-df['M'] = pd.qcut(
-    df['monetary'],
-    5,
-    labels=[1, 2, 3, 4, 5],
-)
-df['RFM'] = df['R'].astype(str) + df['F'].astype(str)
-seg_map = {
-    r'[1-2][1-2]': 'hibernating',
-    r'[1-2][3-4]': 'at_Risk',
-    r'[1-2]5': 'cant_loose',
-    r'3[1-2]': 'about_to_sleep',
-    r'33': 'need_attention',
-    r'[3-4][4-5]': 'loyal_customers',
-    r'41': 'promising',
-    r'51': 'new_customers',
-    r'[4-5][2-3]': 'potential_loyalists',
-    r'5[4-5]': 'champions',
-}
-df['segment'] = df['RFM'].replace(seg_map, regex=True)
-
-df.to_csv('b2c/segment.csv', index=False)
-
-seg = (
-    df.groupby('segment')
-    .size()
-    .reset_index(name='count')
-    .sort_values(by=['count'])
-    .reset_index(drop=True)
-)
-seg.to_csv('b2c/segment_count.csv', index=False)
+
+
+def quintile(e: Expr) -> Expr:
+    return 1 + sum(
+        (e > e.quantile(q, 'linear')).cast(UInt8) for q in (0.2, 0.4, 0.6, 0.8)
+    )
+
+
+@instrumented
+def segment(df: Frame) -> Frame:
+    return (
+        df.with_columns(
+            R=6 - quintile(col('recency').rank('ordinal')),
+            F=quintile(col('frequency')),
+            M=quintile(col('monetary')),
+        )
+        .with_columns(
+            col('R', 'F', 'M').cast(UInt8),
+        )
+        .with_columns(
+            RFM=concat_str(['R', 'F']),
+        )
+        .join(
+            SEGMENTS.lazy() if isinstance(df, LazyFrame) else SEGMENTS,
+            on=['R', 'F'],
+            how='left',
+        )
+    )
+
+
+@instrumented
+def segment_count(df: Frame) -> Frame:
+    return df.groupby('segment').count().sort(['count', 'segment'])
+
+
+if __name__ == '__main__':
+    seg = segment(read('b2c/rfm'))
+    export(seg, 'b2c/segment')
+    export(segment_count(seg), 'b2c/segment_count')
@@ -0,0 +1,94 @@
+from argparse import ArgumentParser
+from functools import lru_cache
+from glob import glob
+from os.path import getmtime, isdir, splitext
+
+from polars import DataFrame, LazyFrame, SQLContext
+
+from partition import scan_partitioned
+from schema import compact
+from utils import FORMATS, locate
+
+DIRS = ['data', 'b2b', 'b2c', 'findings', 'cube']
+KEYS = {
+    'data_customer': ['id'],
+    'data_store': ['id'],
+    'data_employee': ['id'],
+    'data_product': ['id'],
+    'b2c_customer_per_store': ['store'],
+    'findings_non_retail': ['customer_id'],
+    'b2c_rfm': ['customer_id'],
+    'b2c_segment': ['customer_id'],
+    'b2c_segment_count': ['segment'],
+} | {
+    f'{channel}_{table}': key
+    for channel in ('b2b', 'b2c')
+    for table, key in {
+        'sales': ['id', 'product_id'],
+        'total_by_order': ['id'],
+        'order_by_date': ['date'],
+        'order_by_month': ['month'],
+        'timeline': ['grain', 'period'],
+        'total_by_product': ['product_id'],
+        'total_by_customer': ['customer_id'],
+        'total_by_store': ['store_id'],
+    }.items()
+}
+
+
+def tables() -> dict[str, str]:
+    paths = {
+        splitext(file)[0]
+        for d in DIRS
+        for file in glob(f'{d}/*.*')
+        if splitext(file)[1][1:] in FORMATS
+    }
+    datasets = {path.rstrip('/') for d in DIRS for path in glob(f'{d}/*/')}
+    return {
+        path.replace('/', '_'): path if path in datasets else locate(path)
+        for path in sorted(paths | datasets)
+    }
+
+
+def scan(file: str) -> LazyFrame:
+    if isdir(file):
+        # keep the year, month and store keys so filters on them prune partitions
+        return scan_partitioned(file, keys=True)
+    path, fmt = file.rsplit('.', 1)
+    return compact(FORMATS[fmt][2](file), path)
+
+
+def version() -> tuple:
+    return tuple((name, getmtime(file)) for name, file in tables().items())
+
+
+@lru_cache(maxsize=8)
+def context(version: tuple) -> SQLContext:
+    frames = {name: scan(file) for name, file in tables().items()}
+    frames['keys'] = DataFrame(
+        {
+            'table': list(KEYS),
+            'key': [', '.join(key) for key in KEYS.values()],
+        }
+    ).lazy()
+    return SQLContext(frames)
+
+
+@lru_cache(maxsize=256)
+def plan(query: str, version: tuple) -> LazyFrame:
+    return context(version).execute(query)
+
+
+@lru_cache(maxsize=64)
+def cached(query: str, version: tuple) -> DataFrame:
+    return plan(query, version).collect()
+
+
+def run(query: str) -> DataFrame:
+    return cached(query, version())
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('query', help='SQL over the cleaned tables, e.g. b2c_rfm')
+    print(run(parser.parse_args().query))
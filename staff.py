@@ -0,0 +1,97 @@
+from argparse import ArgumentParser
+from datetime import date
+
+from polars import Config, DataFrame, LazyFrame, col, count, struct
+
+from instrument import instrumented
+from utils import read
+
+Frame = DataFrame | LazyFrame
+STORE = 'findings/staff'
+COMMISSION = 0.05
+PERIOD = '1q'
+
+
+@instrumented
+def quarters(lines: Frame) -> Frame:
+    # orders never span partitions, so these sum across them
+    return lines.groupby(
+        'staff_id',
+        col('time').dt.truncate(PERIOD).dt.date().alias('quarter'),
+    ).agg(
+        (col('quantity') * col('price')).sum().alias('revenue'),
+        struct('time', 'id', 'store_id', 'customer_id').n_unique().alias('orders'),
+        count().alias('lines'),
+    )
+
+
+@instrumented
+def facts(quarters: Frame, employee: Frame) -> Frame:
+    return (
+        quarters.with_columns(
+            (col('revenue') / col('orders')).round(2).alias('average'),
+            (col('revenue') * COMMISSION).round(2).alias('commission'),
+            (col('revenue') / col('revenue').sum().over('quarter')).alias('share'),
+            col('revenue').rank('min', descending=True).over('quarter').alias('rank'),
+        )
+        .with_columns(col('revenue').round(2))
+        .join(
+            employee.select(col('id').alias('staff_id'), 'position'),
+            on='staff_id',
+            how='left',
+        )
+        .sort('quarter', 'rank', 'staff_id')
+    )
+
+
+def compare(facts: Frame, before: date, after: date) -> Frame:
+    def period(start: date, suffix: str) -> Frame:
+        return facts.filter(col('quarter') == start).select(
+            'staff_id',
+            'position',
+            *(
+                col(c).alias(f'{c}_{suffix}')
+                for c in ('revenue', 'average', 'commission', 'share', 'rank')
+            ),
+        )
+
+    return (
+        period(before, 'before')
+        .join(
+            period(after, 'after'),
+            on=['staff_id', 'position'],
+            how='outer',
+        )
+        .with_columns(
+            (col('revenue_after') - col('revenue_before')).round(2).alias('change'),
+        )
+        .sort('staff_id')
+    )
+
+
+def top(facts: Frame) -> Frame:
+    return facts.filter(col('rank') == 1)
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument(
+        'before',
+        type=date.fromisoformat,
+        help='first day of the earlier quarter',
+    )
+    parser.add_argument(
+        'after',
+        type=date.fromisoformat,
+        help='first day of the later quarter',
+    )
+    args = parser.parse_args()
+
+    df = read(STORE)
+    with Config(tbl_rows=-1, tbl_cols=-1, tbl_width_chars=160):
+        print(compare(df, args.before, args.after))
+        print(top(df.filter(col('quarter').is_in([args.before, args.after]))))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+from polars import DataFrame, LazyFrame, col, concat, count, lit
+
+from instrument import instrumented
+
+Frame = DataFrame | LazyFrame
+BUCKET = '1h'
+# every grain is a truncation of the hourly buckets, so coarser grains are
+# always sums of finer ones
+GRAINS = {
+    'hour': col('time'),
+    'day': col('time').dt.truncate('1d'),
+    'week': col('time').dt.truncate('1w'),
+    'month': col('time').dt.truncate('1mo'),
+    'quarter': col('time').dt.truncate('1q'),
+    'year': col('time').dt.truncate('1y'),
+}
+MEASURES = ['quantity', 'total', 'orders']
+
+
+@instrumented
+def hourly(orders: Frame, *by: str) -> Frame:
+    return orders.groupby(
+        *by,
+        col('time').dt.truncate(BUCKET),
+    ).agg(
+        col('quantity', 'total').sum(),
+        count().alias('orders'),
+    )
+
+
+@instrumented
+def timeline(hourly: Frame) -> Frame:
+    return concat(
+        [
+            hourly.groupby(period.alias('period'))
+            .agg(col(MEASURES).sum())
+            .select(
+                lit(name).alias('grain'),
+                'period',
+                'quantity',
+                col('total').round(2),
+                'orders',
+            )
+            .sort('period')
+            for name, period in GRAINS.items()
+        ]
+    )
+
+
+def at(timeline: Frame, grain: str, name: str | None = None) -> Frame:
+    return timeline.filter(col('grain') == grain).select(
+        (col('period') if grain == 'hour' else col('period').dt.date()).alias(
+            name or grain
+        ),
+        'quantity',
+        'total',
+    )
@@ -1,7 +1,32 @@
+from functools import partial
+from os import getenv, makedirs
+from os.path import dirname, exists, getmtime, getsize
 from pprint import pformat
 
 from icecream import ic as p
-from polars import DataFrame, read_csv
+from polars import (
+    NUMERIC_DTYPES,
+    Config,
+    DataFrame,
+    Float64,
+    LazyFrame,
+    Utf8,
+    col,
+    count,
+    lit,
+    read_csv,
+    read_ipc,
+    read_ipc_schema,
+    read_parquet,
+    read_parquet_schema,
+    scan_csv,
+    scan_ipc,
+    scan_parquet,
+    struct,
+)
+
+from instrument import instrumented, note
+from schema import compact
 
 
 def custom(o):
@@ -13,8 +38,122 @@ p.configureOutput(
     argToStringFunction=custom,
 )
 
+FORMATS = {
+    'parquet': (
+        DataFrame.write_parquet,
+        read_parquet,
+        scan_parquet,
+    ),
+    'ipc': (
+        DataFrame.write_ipc,
+        partial(read_ipc, memory_map=True),
+        scan_ipc,
+    ),
+    'csv': (
+        DataFrame.write_csv,
+        partial(read_csv, use_pyarrow=True),
+        partial(scan_csv, try_parse_dates=True),
+    ),
+}
+SCHEMAS = {
+    'parquet': read_parquet_schema,
+    'ipc': read_ipc_schema,
+}
+VERIFY = 'full' if getenv('CI') else 'cheap'
+SAMPLE = 100
+TOP_K = 5
+# columns with more distinct values than this share of rows get no top values
+TOP_SHARE = 0.5
+BUCKETS = 1_000_000
+
+
+def sample(lf: LazyFrame, fraction: float, seed: int = 0) -> LazyFrame:
+    return (
+        lf.with_row_count('_row')
+        .filter(col('_row').hash(seed) % BUCKETS < int(fraction * BUCKETS))
+        .drop('_row')
+    )
+
+
+def profile(
+    df: DataFrame | LazyFrame,
+    fraction: float | None = None,
+    k: int = TOP_K,
+    seed: int = 0,
+) -> tuple[dict[str, int], DataFrame]:
+    lf = df.lazy()
+    if fraction:
+        lf = sample(lf, fraction, seed)
+    schema = lf.schema
+    stats = (
+        lf.select(
+            count().alias('rows'),
+            struct(col('*')).hash(seed).approx_unique().alias('distinct'),
+            *(
+                e
+                for c, dtype in schema.items()
+                for e in (
+                    col(c).null_count().alias(f'{c}|nulls'),
+                    col(c).approx_unique().alias(f'{c}|unique'),
+                    col(c).min().cast(Utf8).alias(f'{c}|min'),
+                    col(c).max().cast(Utf8).alias(f'{c}|max'),
+                    (col(c).mean() if dtype in NUMERIC_DTYPES else lit(None))
+                    .cast(Float64)
+                    .alias(f'{c}|mean'),
+                )
+            ),
+        )
+        .collect()
+        .row(0, named=True)
+    )
+    tops = [c for c in schema if stats[f'{c}|unique'] <= TOP_SHARE * stats['rows']]
+    top = (
+        lf.select(
+            col(c).value_counts(sort=True).head(k).implode().alias(c) for c in tops
+        )
+        .collect()
+        .row(0, named=True)
+        if tops
+        else {}
+    )
+    rows = {
+        'rows': stats['rows'],
+        'approx_duplicates': max(stats['rows'] - stats['distinct'], 0),
+    }
+    columns = DataFrame(
+        [
+            {
+                'column': c,
+                'dtype': str(dtype),
+                'nulls': stats[f'{c}|nulls'],
+                'approx_unique': stats[f'{c}|unique'],
+                'min': stats[f'{c}|min'],
+                'max': stats[f'{c}|max'],
+                'mean': stats[f'{c}|mean'],
+                'top': (
+                    ', '.join(f'{v[c]} ({v["counts"]})' for v in top[c])
+                    if c in top
+                    else None
+                ),
+            }
+            for c, dtype in schema.items()
+        ]
+    )
+    return rows, columns
+
 
-def overview(df: DataFrame):
+def overview(
+    df: DataFrame,
+    approx: bool = False,
+    fraction: float | None = None,
+    k: int = TOP_K,
+):
+    if approx or fraction:
+        rows, columns = profile(df, fraction, k)
+        with Config(tbl_rows=-1, tbl_cols=-1, fmt_str_lengths=80):
+            p(rows)
+            p(columns)
+        return
     p(df)
     p(df.describe())
     p(df.null_count())
@@ -29,9 +168,44 @@ def overview(df: DataFrame):
     df.glimpse()
 
 
-def export(df: DataFrame, path: str):
-    df.write_csv(path)
-    assert read_csv(
-        path,
-        use_pyarrow=True,
-    ).frame_equal(df)
+def verify(df: DataFrame, path: str, fmt: str, mode: str = VERIFY):
+    if mode == 'off':
+        return
+    _, read, scan = FORMATS[fmt]
+    if mode == 'full':
+        want = read(df.write_csv().encode()) if fmt == 'csv' else df
+        assert read(path).frame_equal(want)
+        return
+    # csv is checked as the text it was written as
+    lf = scan_csv(path, infer_schema_length=0) if fmt == 'csv' else scan(path)
+    if fmt in SCHEMAS:
+        assert SCHEMAS[fmt](path) == df.schema
+    else:
+        assert lf.columns == df.columns
+    assert lf.select(count()).collect().item() == df.height
+    for offset in {0, df.height // 2, max(df.height - SAMPLE, 0)}:
+        got = lf.slice(offset, SAMPLE).collect()
+        want = df.slice(offset, SAMPLE)
+        if fmt == 'csv':
+            want = read_csv(want.write_csv().encode(), infer_schema_length=0)
+        assert got.frame_equal(want)
+
+
+@instrumented
+def export(df: DataFrame, path: str, fmt: str = 'parquet', mode: str = VERIFY):
+    makedirs(dirname(path) or '.', exist_ok=True)
+    FORMATS[fmt][0](df, f'{path}.{fmt}')
+    note(bytes=getsize(f'{path}.{fmt}'))
+    verify(df, f'{path}.{fmt}', fmt, mode)
+
+
+def locate(path: str) -> str:
+    found = [f'{path}.{fmt}' for fmt in FORMATS if exists(f'{path}.{fmt}')]
+    if not found:
+        raise FileNotFoundError(path)
+    return max(found, key=getmtime)
+
+
+def read(path: str) -> DataFrame:
+    file = locate(path)
+    return compact(FORMATS[file.rsplit('.', 1)[1]][1](file), path)